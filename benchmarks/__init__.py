@@ -0,0 +1 @@
+# Benchmarks run from the repository root, e.g. `python -m benchmarks.bench_parsers`
@@ -0,0 +1,257 @@
+"""
+End-to-end crawl benchmark against the local Amazon stand-in server.
+
+Runs Amazon.search and Amazon.get_product against benchmarks/server.py in a
+scratch data directory and reports pages/sec, page latency percentiles, CPU
+time per page and peak RSS. After every watchlist check, the latest prices in
+the history are compared with the prices the server served last. It then
+measures the cost of history writes and reads as the price history grows.
+
+With `--recorded` the server serves the saved pages of benchmarks/fixtures
+instead of synthetic ones.
+
+Usage:
+    python -m benchmarks.bench_crawl [--queries 2] [--pages 3] [--latency 0.05] [--error-rate 0.05] [--recorded]
+                                     [--watchlist 20] [--rounds 3] [--batch-size 0] [--history-rows 50000] [--output results.jsonl]
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import config
+from .fixtures import fake_asins
+from .server import StandinOptions, serve
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def percentile(values, percentile):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def configure(args, data_dir, base_url):
+    """Point the scraper at the stand-in server and a scratch data directory. Must run before src is imported."""
+    config.AMAZON_BASE_URL = base_url
+    config.LOG_FILE_PATH = os.path.join(data_dir, 'price_log.csv')
+    config.HISTORY_DB_PATH = os.path.join(data_dir, 'price_history.db')
+    config.HISTORY_BACKEND = args.backend
+    config.RESPONSE_CACHE_DIR = os.path.join(data_dir, 'http_cache')
+    config.FRONTIER_PATH = os.path.join(data_dir, 'frontier.db')
+    config.IDENTITY_STATE_PATH = None
+    config.NOTIFICATION_SINKS = []
+    config.FETCH_CONCURRENCY = args.concurrency
+    config.PARSE_WORKERS = args.parse_workers
+    config.HOST_REQUESTS_PER_SECOND = args.rate
+    config.WATCHLIST_BATCH_MODE = args.batch_size > 0
+    config.WATCHLIST_BATCH_SIZE = args.batch_size or config.WATCHLIST_BATCH_SIZE
+    config.HOST_BURST = max(1, args.concurrency)
+    # The stand-in answers 503s at random, so bans and backoff are kept short
+    config.IDENTITY_BAN_COOLDOWN = 0.1
+    config.IDENTITY_ERROR_COOLDOWN = 0.1
+    config.IDENTITY_MAX_COOLDOWN = 1
+    config.RETRY_MAX_DELAY = 0.5
+    config.CIRCUIT_503_THRESHOLD = 1.0
+
+
+class PageTimer:
+    """Wraps the functions fetching a page and records how long each call took."""
+
+    def __init__(self):
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def wrap(self, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.latencies.append(elapsed)
+        return timed
+
+    def reset(self):
+        with self._lock:
+            latencies, self.latencies = self.latencies, []
+        return latencies
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(f'{base_url}/__stats') as response:
+        return json.load(response)
+
+
+def price_mismatches(base_url, asins):
+    """Return the ASINs whose latest price in the history is not the price the server served last."""
+    from src.history_store import get_history_store
+    with urllib.request.urlopen(f'{base_url}/__prices') as response:
+        served = json.load(response)
+    latest = get_history_store().latest_prices()
+    return [asin for asin in asins if asin in served and latest.get(asin) is not None and round(latest[asin], 2) != served[asin]]
+
+
+def measure(name, run, timer, base_url):
+    """Run one crawl and return its throughput and latency figures."""
+    before = server_stats(base_url)
+    cpu = time.process_time()
+    start = time.perf_counter()
+    run()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    after = server_stats(base_url)
+    served = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+    pages = served.get('listing', 0) + served.get('product', 0)
+    latencies = timer.reset()
+    return {
+        'name': name,
+        'pages': pages,
+        'errors_503': served.get('listing_503', 0) + served.get('product_503', 0),
+        'seconds': wall,
+        'pages_per_sec': pages / wall if wall else None,
+        'latency_p50_ms': (percentile(latencies, 50) or 0) * 1000,
+        'latency_p99_ms': (percentile(latencies, 99) or 0) * 1000,
+        'cpu_ms_per_page': cpu * 1000 / pages if pages else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_history(data_dir, total_rows, batch_size, checkpoints=5):
+    """Append synthetic batches to each history backend and time writes and reads as the history grows."""
+    from src.history_store import CsvHistoryStore, SqliteHistoryStore
+
+    asins = fake_asins(1000)
+    results = []
+    for backend, store in (
+        ('csv', CsvHistoryStore(os.path.join(data_dir, 'growth.csv'))),
+        ('sqlite', SqliteHistoryStore(os.path.join(data_dir, 'growth.db'))),
+    ):
+        written = 0
+        step = max(batch_size, total_rows // checkpoints)
+        while written < total_rows:
+            target = min(total_rows, written + step)
+            append_times = []
+            while written < target:
+                batch = [
+                    {
+                        'asin': asins[(written + i) % len(asins)],
+                        'title': 'Product', 'price': 10 + (written + i) % 90, 'rating': '4.5',
+                        'image': '', 'url': '', 'timestamp': f'2025-01-01 00:00:{(written + i) % 60:02d}',
+                    }
+                    for i in range(min(batch_size, target - written))
+                ]
+                start = time.perf_counter()
+                store.append(batch)
+                append_times.append(time.perf_counter() - start)
+                written += len(batch)
+            start = time.perf_counter()
+            store.latest_prices()
+            latest = time.perf_counter() - start
+            start = time.perf_counter()
+            store.history(asins[0])
+            series = time.perf_counter() - start
+            results.append({
+                'name': f'history-{backend}',
+                'rows': written,
+                'append_ms_per_batch': sum(append_times) / len(append_times) * 1000,
+                'latest_prices_ms': latest * 1000,
+                'history_ms': series * 1000,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=2, help='Number of search queries')
+    parser.add_argument('--pages', type=int, default=3, help='Result pages per search')
+    parser.add_argument('--products-per-page', type=int, default=24, help='Products per search page (recorded pages keep their own count)')
+    parser.add_argument('--recorded', action='store_true', help='Serve the saved pages of benchmarks/fixtures instead of synthetic ones')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='Share of responses answered with a 503')
+    parser.add_argument('--watchlist', type=int, default=20, help='Number of product URLs checked by get_product')
+    parser.add_argument('--rounds', type=int, default=3, help='Number of watchlist checks')
+    parser.add_argument('--batch-size', type=int, default=0, help='Check the watchlist through batch searches of this many products (0 fetches every product page)')
+    parser.add_argument('--concurrency', type=int, default=config.FETCH_CONCURRENCY, help='FETCH_CONCURRENCY')
+    parser.add_argument('--parse-workers', type=int, default=config.PARSE_WORKERS, help='PARSE_WORKERS')
+    parser.add_argument('--rate', type=float, default=1000.0, help='Requests per second allowed by the rate limiter')
+    parser.add_argument('--backend', choices=('csv', 'sqlite'), default=config.HISTORY_BACKEND, help='HISTORY_BACKEND')
+    parser.add_argument('--history-rows', type=int, default=50000, help='Rows appended by the history growth benchmark (0 skips it)')
+    parser.add_argument('--output', help='Append the results as one JSON line to this file')
+    args = parser.parse_args()
+
+    options = StandinOptions(args.latency, args.error_rate, args.pages, args.products_per_page, recorded=args.recorded)
+    ready = multiprocessing.Queue()
+    # The server runs in its own process so its CPU time is not counted
+    server = multiprocessing.Process(target=serve, args=(options,), kwargs={'ready': ready}, daemon=True)
+    server.start()
+    base_url = f'http://127.0.0.1:{ready.get(timeout=60)}'
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='amazon_scraper_bench_') as data_dir:
+        configure(args, data_dir, base_url)
+        from src import amazon_scraper
+        from src.amazon_scraper import Amazon
+
+        timer = PageTimer()
+        amazon_scraper.get_product_info = timer.wrap(amazon_scraper.get_product_info)
+        amazon_scraper.fetch_listing_page = timer.wrap(amazon_scraper.fetch_listing_page)
+        amazon_scraper.fetch_batch_page = timer.wrap(amazon_scraper.fetch_batch_page)
+
+        queries = [f'bench query {i}' for i in range(args.queries)]
+        results.append(measure('search', lambda: Amazon.search(queries, max_pages=args.pages, run_id='bench-search'), timer, base_url))
+
+        asins = fake_asins(args.watchlist, prefix='B1')
+        urls = [f'{base_url}/dp/{asin}' for asin in asins]
+        for round_number in range(1, args.rounds + 1):
+            results.append(measure(f'watchlist-{round_number}', lambda: Amazon.get_product(urls, run_id=f'bench-watchlist-{round_number}'), timer, base_url))
+            results[-1]['price_mismatches'] = len(price_mismatches(base_url, asins))
+
+        if args.history_rows:
+            results.extend(bench_history(data_dir, args.history_rows, config.HISTORY_BATCH_SIZE))
+    server.terminate()
+
+    print(f"{'run':<14}{'pages':>7}{'503s':>6}{'pages/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'cpu ms/page':>13}{'peak MB':>9}{'wrong prices':>14}")
+    for result in results:
+        if 'pages' in result:
+            print(
+                f"{result['name']:<14}{result['pages']:>7}{result['errors_503']:>6}{result['pages_per_sec']:>9.1f}"
+                f"{result['latency_p50_ms']:>9.1f}{result['latency_p99_ms']:>9.1f}"
+                f"{result['cpu_ms_per_page'] or 0:>13.1f}{result['peak_rss_mb'] or 0:>9.0f}{result.get('price_mismatches', '-'):>14}"
+            )
+    history = [result for result in results if 'rows' in result]
+    if history:
+        print(f"\n{'history':<16}{'rows':>9}{'append ms':>11}{'latest ms':>11}{'series ms':>11}")
+        for result in history:
+            print(
+                f"{result['name']:<16}{result['rows']:>9}{result['append_ms_per_batch']:>11.2f}"
+                f"{result['latest_prices_ms']:>11.2f}{result['history_ms']:>11.2f}"
+            )
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'args': vars(args), 'results': results}) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the HTML extraction engines on fixture pages.
+
+Saved pages that come with a .json file of their expected fields (see
+benchmarks/fixtures/README.md) are checked first: the product fields, the
+buy-box price included, and the price of every search result card.
+
+Usage:
+    python -m benchmarks.bench_parsers [--repeat N]
+"""
+import argparse
+import time
+from src.extractors import ENGINES, extract_listing, extract_listing_cards, extract_product, resolve_engine
+from .fixtures import load_pages, load_recorded
+
+
+def bench(fn, pages, repeat):
+    timings = []
+    for _ in range(repeat):
+        for page in pages:
+            start = time.perf_counter()
+            fn(page)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return sum(timings) / len(timings), timings[len(timings) // 2]
+
+
+def check_recorded(engine):
+    """Return the differences between what `engine` extracts from the saved pages and their expected fields."""
+    errors = []
+    for page, expected in load_recorded('product'):
+        fields = extract_product(page, engine)
+        fields['title'] = fields['title'].strip() if fields['title'] is not None else None
+        for name in ('title', 'price', 'rating', 'image'):
+            if fields[name] != expected[name]:
+                errors.append(f"product {expected['asin']} {name}: {fields[name]!r} instead of {expected[name]!r}")
+    for page, expected in load_recorded('listing'):
+        hrefs, next_href = extract_listing(page, engine)
+        if len(hrefs) != expected['products'] or next_href != expected['next_href']:
+            errors.append(f"listing: {len(hrefs)} products and next page {next_href!r} instead of {expected['products']} and {expected['next_href']!r}")
+        prices = {card['asin']: card['price'] for card in extract_listing_cards(page, engine)}
+        for card in expected['cards']:
+            if prices.get(card['asin']) != card['price']:
+                errors.append(f"card {card['asin']} price: {prices.get(card['asin'])!r} instead of {card['price']!r}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='Number of times each page is parsed')
+    args = parser.parse_args()
+
+    product_pages = load_pages('product')
+    listing_pages = load_pages('listing')
+    print(f"{len(product_pages)} product page(s), {len(listing_pages)} listing page(s)")
+
+    for engine in ENGINES:
+        if resolve_engine(engine) == engine:
+            errors = check_recorded(engine)
+            print(f"{engine:<12}expected fields of saved pages: {'ok' if not errors else f'{len(errors)} wrong'}")
+            for error in errors:
+                print(f"  {error}")
+
+    # Every engine has to agree with BeautifulSoup before its timings mean anything
+    expected_product = [extract_product(page, 'bs4') for page in product_pages]
+    expected_listing = [extract_listing(page, 'bs4') for page in listing_pages]
+
+    print(f"{'engine':<12}{'page':<10}{'mean ms':>10}{'median ms':>12}  matches bs4")
+    for engine in ENGINES:
+        if resolve_engine(engine) != engine:
+            print(f"{engine:<12}(not installed)")
+            continue
+        product_ok = [extract_product(page, engine) for page in product_pages] == expected_product
+        listing_ok = [extract_listing(page, engine) for page in listing_pages] == expected_listing
+        for kind, fn, pages, ok in (
+            ('product', lambda page: extract_product(page, engine), product_pages, product_ok),
+            ('listing', lambda page: extract_listing(page, engine), listing_pages, listing_ok),
+        ):
+            mean, median = bench(fn, pages, args.repeat)
+            print(f"{engine:<12}{kind:<10}{mean * 1000:>10.2f}{median * 1000:>12.2f}  {ok}")
+
+
+if __name__ == "__main__":
+    main()
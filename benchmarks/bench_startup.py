@@ -0,0 +1,119 @@
+"""
+Startup-time benchmark of the src package.
+
+Runs each import statement in fresh interpreters (`python -X importtime`) and
+reports the median wall time, the import time of the slowest modules, the peak
+RSS of the process and whether the GUI / charting stack (tkinter, plotly) or
+BeautifulSoup got loaded.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--top 5] [--output results.jsonl]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Statements timed by default, from the cheapest entry point to the full scraper
+STATEMENTS = [
+    'import src',
+    'import src.jobs',
+    'import src.compaction',
+    'from src.notifier import get_dispatcher; get_dispatcher()',
+    'from src import Amazon',
+    'import src.notification',
+]
+
+# Modules that a headless worker should never load
+HEAVY_MODULES = ('tkinter', 'plotly', 'bs4')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Appended to every statement so the child reports its own peak RSS
+_REPORT_RSS = '''
+try:
+    import resource
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+except ImportError:
+    print(-1)
+'''
+
+
+def parse_importtime(stderr: str):
+    """Return {module: (self us, cumulative us)} from the output of -X importtime."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(statement: str):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement + '\n' + _REPORT_RSS],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    peak = int(completed.stdout.strip().splitlines()[-1])
+    # Kilobytes on Linux, bytes on macOS
+    peak_mb = None if peak < 0 else peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return wall, peak_mb, parse_importtime(completed.stderr)
+
+
+def measure(statement: str, runs: int, top: int):
+    walls, peaks, modules = [], [], {}
+    for _ in range(runs):
+        wall, peak_mb, modules = run_once(statement)
+        walls.append(wall)
+        if peak_mb is not None:
+            peaks.append(peak_mb)
+    # Modules ranked by their own import time, from the last run
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        'statement': statement,
+        'runs': runs,
+        'wall_ms_median': statistics.median(walls) * 1000,
+        'wall_ms_min': min(walls) * 1000,
+        'import_ms': sum(cumulative for name, (_, cumulative) in modules.items() if '.' not in name) / 1000,
+        'modules': len(modules),
+        'peak_rss_mb': statistics.median(peaks) if peaks else None,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in modules],
+        'slowest_modules': [{'module': name, 'self_ms': self_us / 1000} for name, (self_us, _) in slowest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per statement')
+    parser.add_argument('--top', type=int, default=5, help='Number of slowest modules listed per statement')
+    parser.add_argument('--statement', action='append', help='Statement to time (repeatable, replaces the defaults)')
+    parser.add_argument('--output', help='Append the results as one JSON line to this file')
+    args = parser.parse_args()
+
+    baseline = measure('pass', args.runs, 0)
+    results = [measure(statement, args.runs, args.top) for statement in args.statement or STATEMENTS]
+
+    print(f"interpreter startup: {baseline['wall_ms_median']:.0f} ms, {baseline['peak_rss_mb'] or 0:.0f} MB\n")
+    print(f"{'statement':<60}{'wall ms':>9}{'import ms':>11}{'modules':>9}{'peak MB':>9}  heavy")
+    for result in results:
+        print(
+            f"{result['statement'][:59]:<60}{result['wall_ms_median']:>9.0f}{result['import_ms']:>11.0f}"
+            f"{result['modules']:>9}{result['peak_rss_mb'] or 0:>9.0f}  {', '.join(result['heavy_modules']) or '-'}"
+        )
+    for result in results:
+        slowest = ', '.join(f"{entry['module']} {entry['self_ms']:.0f}ms" for entry in result['slowest_modules'])
+        print(f"\n{result['statement']}\n  slowest: {slowest}")
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'args': vars(args), 'baseline': baseline, 'results': results}) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import glob
+import html
+import json
+import os
+import random
+import re
+from typing import Dict, List, Optional, Tuple
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Filler markup repeated to bring synthetic pages to the size of real Amazon pages
+_FILLER_BLOCK = (
+    '<div class="a-section a-spacing-small"><span class="a-size-base a-color-secondary">{text}</span>'
+    '<ul class="a-unordered-list a-vertical"><li><span class="a-list-item">{text}</span></li></ul></div>'
+)
+_SCRIPT_BLOCK = '<script type="text/javascript">P.when("A").execute(function(A){{var d={data};}});</script>'
+
+
+def _filler(size: int, seed: int) -> str:
+    rng = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        text = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(80))
+        block = _FILLER_BLOCK.format(text=text) if rng.random() < 0.7 else _SCRIPT_BLOCK.format(data=repr(text))
+        parts.append(block)
+        total += len(block)
+    return ''.join(parts)
+
+
+def product_page(asin: str = 'B0BHZT5S12', price: float = 139.99, title: str = 'Amazon Fire HD 10 tablet', size: int = 1_500_000) -> str:
+    """Return a synthetic product page with the nodes read by get_product_info."""
+    return (
+        '<!doctype html><html><head><title>Amazon.com</title>'
+        f'{_filler(size // 5, 1)}</head><body>'
+        f'{_filler(size // 10, 2)}'
+        f'<div id="centerCol"><h1><span id="productTitle" class="a-size-large"> {title} </span></h1>'
+        f'<span id="acrPopover" class="reviewCountTextLinkedHistogram" title="4.5 out of 5 stars"></span>'
+        f'<div id="corePrice_feature_div"><span class="a-price"><span class="a-offscreen">${price:,.2f}</span></span></div></div>'
+        f'<div id="imgTagWrapperId"><img id="landingImage" src="https://m.media-amazon.com/images/I/{asin}.jpg"></div>'
+        f'{_filler(size - size // 5 - size // 10, 3)}'
+        '</body></html>'
+    )
+
+
+def listing_page(asins: List[str], next_href: Optional[str] = None, size: int = 800_000, prices: Optional[List[float]] = None) -> str:
+    """Return a synthetic search results page with one card per ASIN (priced from `prices` if given)."""
+    if prices is None:
+        prices = [10 + i + 0.99 for i in range(1, len(asins) + 1)]
+    cards = ''.join(
+        f'<div data-asin="{asin}" data-component-type="s-search-result" class="s-result-item">'
+        f'<div data-cy="title-recipe"><a class="a-link-normal s-link-style" '
+        f'href="/Product-{asin}/dp/{asin}/ref=sr_1_{i}?dib=eyJ2IjoiMSJ9&qid=1738356545&sr=1-{i}">'
+        f'<h2><span>Product {asin}</span></h2></a></div>'
+        f'<span class="a-icon-alt">4.{i % 10} out of 5 stars</span>'
+        f'<span class="a-price"><span class="a-offscreen">${price:,.2f}</span></span>'
+        f'{_filler(size // max(1, len(asins)) // 2, i)}</div>'
+        for i, (asin, price) in enumerate(zip(asins, prices), start=1)
+    )
+    pagination = (
+        f'<a class="s-pagination-item s-pagination-next" href="{next_href}">Next</a>'
+        if next_href else
+        '<span class="s-pagination-item s-pagination-next s-pagination-disabled">Next</span>'
+    )
+    return (
+        '<!doctype html><html><head><title>Amazon.com : search</title>'
+        f'{_filler(size // 4, 7)}</head><body><div class="s-main-slot">{cards}</div>'
+        f'<div class="s-pagination-strip">{pagination}</div></body></html>'
+    )
+
+
+def fake_asins(count: int, prefix: str = 'B0') -> List[str]:
+    """Return `count` distinct ten-character ASINs."""
+    return [f'{prefix}{index:08d}' for index in range(count)]
+
+
+def load_recorded(kind: str) -> List[Tuple[str, Dict]]:
+    """
+    Return the saved pages of a kind ('product' or 'listing') that come with the fields expected from them.
+
+    The expected fields are read from the JSON file next to each page (product.json for product.html).
+    """
+    recorded = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, f'{kind}*.html'))):
+        expected_path = os.path.splitext(path)[0] + '.json'
+        if not os.path.exists(expected_path):
+            continue
+        with open(path, encoding='utf-8', errors='replace') as f:
+            page = f.read()
+        with open(expected_path, encoding='utf-8') as f:
+            recorded.append((page, json.load(f)))
+    return recorded
+
+
+def _price_markup(price: str) -> List[str]:
+    """Return the markup showing a price like '$1,099.99': the a-offscreen text and the visible whole / fraction spans."""
+    whole, fraction = price.lstrip('$').split('.')
+    return [f'>{price}<', f'>{whole}<span class="a-price-decimal">.</span></span><span class="a-price-fraction">{fraction}<']
+
+
+def _replace_price(page: str, old: str, new: float) -> str:
+    for before, after in zip(_price_markup(old), _price_markup(f'${new:,.2f}')):
+        page = page.replace(before, after)
+    return page
+
+
+def recorded_product_page(page: str, expected: Dict, asin: str, price: float) -> str:
+    """Turn a saved product page into the page of another ASIN with its buy-box price set to `price`."""
+    return _replace_price(page.replace(expected['asin'], asin), expected['price'], price)
+
+
+def recorded_listing_page(page: str, expected: Dict, asins: List[str], next_href: Optional[str] = None,
+                          prices: Optional[List[float]] = None) -> str:
+    """
+    Turn a saved search page into a page listing `asins`, in the place of the recorded result cards.
+
+    The cards past the last ASIN keep their recorded product. With `prices`, the price of every
+    card showing one of `asins` is replaced. Without `next_href`, the page is the last one.
+    """
+    cards = expected['cards'][:len(asins)]
+    # Card boundaries, so every price is replaced in its own card only
+    starts = [page.index(f'data-asin="{card["asin"]}" data-index=') for card in cards]
+    bounds = list(zip(starts, starts[1:] + [page.index('s-pagination-strip')]))
+    parts, position = [], 0
+    for index, (card, (start, end)) in enumerate(zip(cards, bounds)):
+        parts.append(page[position:start])
+        card_markup = page[start:end].replace(card['asin'], asins[index])
+        if prices is not None and card['price'] is not None:
+            card_markup = _replace_price(card_markup, card['price'], prices[index])
+        parts.append(card_markup)
+        position = end
+    parts.append(page[position:])
+    page = ''.join(parts)
+
+    recorded_next = html.escape(expected['next_href'], quote=True)
+    if next_href is not None:
+        return page.replace(f'href="{recorded_next}"', f'href="{html.escape(next_href, quote=True)}"')
+    return re.sub(
+        r'<a [^>]*class="[^"]*s-pagination-next[^"]*"[^>]*>(.*?)</a>',
+        r'<span class="s-pagination-item s-pagination-next s-pagination-disabled " aria-disabled="true">\1</span>',
+        page,
+    )
+
+
+def load_pages(kind: str) -> List[str]:
+    """Return the saved fixture pages of a kind ('product' or 'listing'), or a synthetic one if none are saved."""
+    paths = sorted(glob.glob(os.path.join(FIXTURES_DIR, f'{kind}*.html')))
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+        return pages
+    if kind == 'product':
+        return [product_page()]
+    return [listing_page(fake_asins(48), next_href='/s?k=Kindle+Fire&page=2')]
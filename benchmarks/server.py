@@ -0,0 +1,204 @@
+"""
+Local stand-in for amazon.com serving synthetic search and product pages
+(or, with `--recorded`, the saved pages of benchmarks/fixtures).
+
+Search pages (/s?k=<query>&page=<n>) list `--products-per-page` products and
+link to the next page until `--pages` is reached. ASIN searches
+(/s?rh=p_78:<ASIN>|<ASIN>...) list the requested products at their current price. Product pages are served
+for /dp/<ASIN> and for tracked links (/<slug>/dp/<ASIN>/ref=...). Every
+response can be delayed by `--latency` seconds, and a share `--error-rate`
+of them is answered with a 503. /__stats returns the request counts and
+/__prices the last price served for every ASIN.
+
+Recorded search pages list as many products as the saved page has result
+cards, whatever `--products-per-page` says.
+
+Usage:
+    python -m benchmarks.server [--port 8000] [--latency 0.05] [--error-rate 0.05] [--pages 5] [--recorded]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs, quote_plus, urlparse
+from .fixtures import listing_page, load_recorded, product_page, recorded_listing_page, recorded_product_page
+
+# Placeholders substituted into the cached product page template
+_ASIN_PLACEHOLDER = 'QQQQQQQQQQ'
+_TITLE_PLACEHOLDER = 'QQTITLEQQ'
+_PRICE_PLACEHOLDER = 98765.43
+
+
+class StandinOptions:
+    """What the stand-in server serves and how it misbehaves."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, pages: int = 5, products_per_page: int = 48,
+                 price_change_rate: float = 0.5, product_size: int = 1_500_000, listing_size: int = 800_000, seed: int = 0,
+                 recorded: bool = False):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pages = pages
+        self.products_per_page = products_per_page
+        self.price_change_rate = price_change_rate
+        self.product_size = product_size
+        self.listing_size = listing_size
+        self.seed = seed
+        self.recorded = recorded
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options: StandinOptions):
+        super().__init__(address, StandinHandler)
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.listings = {}
+        self.prices = {}
+        # Generating the filler of a page is slow, so every product page is cut from one template
+        self.product_template = product_page(_ASIN_PLACEHOLDER, _PRICE_PLACEHOLDER, _TITLE_PLACEHOLDER, options.product_size)
+        # Saved (page, expected fields) pairs served instead of the synthetic pages
+        self.recorded_product = self.recorded_listing = None
+        if options.recorded:
+            products, listings = load_recorded('product'), load_recorded('listing')
+            if not products or not listings:
+                raise FileNotFoundError('--recorded needs a product and a listing page with their .json files in benchmarks/fixtures')
+            self.recorded_product, self.recorded_listing = products[0], listings[0]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def listing(self, query: str, page: int) -> str:
+        with self.lock:
+            html = self.listings.get((query, page))
+        if html is None:
+            per_page = self.options.products_per_page
+            if self.recorded_listing is not None:
+                per_page = len(self.recorded_listing[1]['cards'])
+            prefix = zlib.crc32(query.encode()) % 100
+            asins = [f'B0{prefix:02d}{index:06d}' for index in range((page - 1) * per_page, page * per_page)]
+            next_href = f'/s?k={quote_plus(query)}&page={page + 1}' if page < self.options.pages else None
+            if self.recorded_listing is not None:
+                html = recorded_listing_page(*self.recorded_listing, asins, next_href)
+            else:
+                html = listing_page(asins, next_href, self.options.listing_size)
+            with self.lock:
+                self.listings[(query, page)] = html
+        return html
+
+    def price(self, asin: str) -> float:
+        """Return the current price of a product, which changes on a share `price_change_rate` of the requests."""
+        with self.lock:
+            price = self.prices.get(asin)
+            if price is None or self.random.random() < self.options.price_change_rate:
+                price = self.prices[asin] = round(self.random.uniform(20, 200), 2)
+        return price
+
+    def asin_listing(self, asins: List[str]) -> str:
+        prices = [self.price(asin) for asin in asins]
+        if self.recorded_listing is not None:
+            return recorded_listing_page(*self.recorded_listing, asins, None, prices)
+        return listing_page(asins, None, self.options.listing_size, prices)
+
+    def product(self, asin: str) -> str:
+        price = self.price(asin)
+        if self.recorded_product is not None:
+            return recorded_product_page(*self.recorded_product, asin, price)
+        return (
+            self.product_template
+            .replace(_ASIN_PLACEHOLDER, asin)
+            .replace(_TITLE_PLACEHOLDER, f'Product {asin}')
+            .replace(f'${_PRICE_PLACEHOLDER:,.2f}', f'${price:,.2f}')
+        )
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = 'text/html; charset=utf-8', headers=None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        if parsed.path == '/__stats':
+            with server.lock:
+                self._send(200, json.dumps(server.stats), 'application/json')
+            return
+        if parsed.path == '/__prices':
+            with server.lock:
+                self._send(200, json.dumps(server.prices), 'application/json')
+            return
+
+        if server.options.latency:
+            time.sleep(server.options.latency)
+        with server.lock:
+            unavailable = server.random.random() < server.options.error_rate
+        kind = 'listing' if parsed.path == '/s' else 'product' if '/dp/' in parsed.path else 'other'
+        with server.lock:
+            server.stats[f'{kind}_503' if unavailable else kind] += 1
+        if unavailable:
+            self._send(503, 'Service Unavailable', 'text/plain', {'Retry-After': '0'})
+        elif kind == 'listing':
+            params = parse_qs(parsed.query)
+            query = params.get('k', [''])[0]
+            page = int(params.get('page', ['1'])[0])
+            refinement = params.get('rh', [''])[0]
+            if refinement.startswith('p_78:'):
+                self._send(200, server.asin_listing(refinement[len('p_78:'):].split('|')))
+            elif page > server.options.pages:
+                self._send(404, 'Not Found', 'text/plain')
+            else:
+                self._send(200, server.listing(query, page))
+        elif kind == 'product':
+            asin = parsed.path.split('/dp/', 1)[1].split('/', 1)[0]
+            self._send(200, server.product(asin))
+        else:
+            self._send(404, 'Not Found', 'text/plain')
+
+
+def serve(options: StandinOptions, host: str = '127.0.0.1', port: int = 0, ready=None):
+    """Serve until the process is stopped. The bound port is put on `ready` (a queue) once listening."""
+    server = StandinServer((host, port), options)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of responses answered with a 503')
+    parser.add_argument('--pages', type=int, default=5, help='Number of result pages per search')
+    parser.add_argument('--products-per-page', type=int, default=48)
+    parser.add_argument('--price-change-rate', type=float, default=0.5, help='Probability that a product price changes between two requests')
+    parser.add_argument('--recorded', action='store_true', help='Serve the saved pages of benchmarks/fixtures instead of synthetic ones')
+    args = parser.parse_args()
+
+    options = StandinOptions(args.latency, args.error_rate, args.pages, args.products_per_page, args.price_change_rate, recorded=args.recorded)
+    print(f"Serving the Amazon stand-in on http://127.0.0.1:{args.port}")
+    serve(options, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,25 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 log_directory = 'logs'
 
+# Records are formatted and written by a background listener, so logging
+# from a fetch worker only puts the record on a queue
+file_handler = logging.FileHandler(os.path.join(log_directory, 'app.log'), mode='a')  # Log file name, append mode
+file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))  # Log format
+log_queue = queue.SimpleQueue()
+listener = logging.handlers.QueueListener(log_queue, file_handler)
+listener.start()
+atexit.register(listener.stop)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))  # The file handler adds the time, name and level
+
 # Configure the logger
 logging.basicConfig(
-  filename=os.path.join(log_directory, 'app.log'),  # Log file name
-  filemode='a',        # Append mode
-  format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # Log format
+  handlers=[queue_handler],
   level=logging.DEBUG  # Log level
 )
 
@@ -16,4 +28,4 @@ logger = logging.getLogger('AmazonScraperLogger')
 
 # Example usage
 if __name__ == "__main__":
-  logger.info('Logger is configured and ready to use.')
\ No newline at end of file
+  logger.info('Logger is configured and ready to use.')
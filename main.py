@@ -1,7 +1,8 @@
-import schedule
-import time
 from src import Amazon
-from config import CHECK_FREQUENCY, AMAZON_QUERY_PARAMS, AMAZON_PRODUCT_URLS
+from src.jobs import JobRunner
+from src.compaction import compact_history
+from src.metrics import start_exporter, start_profiler
+from config import CHECK_FREQUENCY, AMAZON_QUERY_PARAMS, AMAZON_PRODUCT_URLS, COMPACTION_INTERVAL
 
 queries = AMAZON_QUERY_PARAMS
 
@@ -13,21 +14,34 @@ def scrap_amazon():
 def scrap_amazon_product():
   Amazon.get_product(product_urls)
 
-def schedule_tasks():
-  # Scrap Amazon specific product every {CHECK_FREQUENCY} seconds
-  schedule.every(CHECK_FREQUENCY).seconds.do(scrap_amazon_product)
+def schedule_tasks(runner: JobRunner):
+  # Scrap Amazon specific product every {CHECK_FREQUENCY} seconds.
+  # It has the highest priority, and a check that could not start within one period is dropped
+  # since the next one is already due.
+  runner.add('watchlist', scrap_amazon_product, CHECK_FREQUENCY, priority=10, deadline=CHECK_FREQUENCY, overlap='skip')
   
-  # Scrap Amazon every day with the search queries
-  schedule.every().day.do(scrap_amazon)
+  # Scrap Amazon every day with the search queries.
+  # The crawl runs in its own executor, so the watchlist keeps its cadence while it runs.
+  runner.add('search', scrap_amazon, 24 * 60 * 60, priority=0, overlap='coalesce')
+  
+  # Compact the price history (unchanged prices and old rows) so it stops growing with the check frequency.
+  # Opt-in: it deletes rows, so enable it on one node only.
+  if COMPACTION_INTERVAL:
+    runner.add('compaction', compact_history, COMPACTION_INTERVAL, priority=-10, overlap='skip')
   
   # Additional scheduled tasks can be added here if needed
   
 
 def main():
-  schedule_tasks()
-  while True:
-    schedule.run_pending()
-    time.sleep(1)
+  start_exporter()
+  start_profiler()
+  runner = JobRunner()
+  schedule_tasks(runner)
+  try:
+    runner.run_forever()
+  except KeyboardInterrupt:
+    runner.stop(wait=False)
+    runner.log_report()
 
 if __name__ == "__main__":
   main()
@@ -1,2 +1,19 @@
-from .amazon_scraper import Amazon
-# Can add scrapers for other websites here
\ No newline at end of file
+# Scrapers are imported on first use (`from src import Amazon`), so importing a
+# submodule such as src.jobs or src.compaction does not load the scraping stack
+_SCRAPERS = {
+    'Amazon': '.amazon_scraper',
+}
+# Can add scrapers for other websites here
+
+
+def __getattr__(name):
+    if name in _SCRAPERS:
+        from importlib import import_module
+        value = getattr(import_module(_SCRAPERS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_SCRAPERS))
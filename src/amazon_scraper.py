@@ -1,163 +1,166 @@
-import os
-from bs4 import BeautifulSoup
-import re
-from urllib.parse import urljoin, unquote, urlparse, parse_qs
-import pandas as pd
+import threading
 import time
+from collections import Counter
+from urllib.parse import urljoin
+import pandas as pd
 from datetime import datetime
-from typing import List, Optional, Union, Dict, Set
-from config import CUSTOM_HEADERS, PRICE_DROP_THRESHOLD, LOG_FILE_PATH, CHECK_FREQUENCY, PRICE_DROP_MODE 
-from .notification import display_notification
+from typing import Iterator, List, Optional, Tuple, Union, Dict, Set
+from config import CUSTOM_HEADERS, CHECK_FREQUENCY, RETRY_MAX_ATTEMPTS, AMAZON_BASE_URL, FETCH_CONCURRENCY, FRONTIER_LEASE_SECONDS, FRONTIER_POLL_INTERVAL, WATCHLIST_BATCH_MODE, WATCHLIST_BATCH_SIZE, WATCHLIST_FETCH_PRIORITY
+from .notifier import Digest, get_dispatcher
 from .fetch_with_retries import fetch_with_retries
+from .pipeline import BatchedSink, run_pipeline
+from .retry_scheduler import RetryLater
+from .frontier import Frontier, WorkItem, get_frontier, default_node_id
+from .parse_pool import get_parse_pool
+from .response_cache import get_price_fingerprints
+from .urls import extract_asin, canonicalize_product_url, batch_search_asins, batch_search_urls, batch_product_urls
+from .history_store import get_history_store
+from .price_index import get_price_index
+from .metrics import get_metrics
+from .price_drops import detect_price_drops
+from .records import ProductRecord, RecordBatch
 from logs import logging
 
-PRICE_DROP_THRESHOLD = float(PRICE_DROP_THRESHOLD)
-
-def extract_asin(url):
-    """Extract ASIN from Amazon URLs (direct or tracked)."""
-    # Decode URL-encoded characters
-    decoded_url = unquote(url)
-    
-    # Case 1: ASIN in the URL path (e.g., /dp/B0XXXXXX)
-    asin_pattern = r"/dp/([A-Z0-9]{10})|/gp/product/([A-Z0-9]{10})"
-    match = re.search(asin_pattern, decoded_url)
-    if match:
-        asin = (match.group(1) or match.group(2)).upper()
-        return asin
-    
-    # Case 2: ASIN in query parameters (e.g., pd_rd_i=B0XXXXXX)
-    parsed_url = urlparse(decoded_url)
-    query_params = parse_qs(parsed_url.query)
-    
-    # Check common ASIN-carrying parameters
-    asin_params = ["pd_rd_i", "asin", "product_id"]
-    for param in asin_params:
-        if param in query_params:
-            asin_candidate = query_params[param][0]
-            if len(asin_candidate) == 10 and asin_candidate.isalnum():
-                return asin_candidate.upper()  # ASINs are uppercase
-    
-    return None
-
 def load_previous_price(asin=None):
-    """Load the previous price data from the log file."""
-    try:
-        df = pd.read_csv(LOG_FILE_PATH)
-        # Ensure timestamp is in datetime format
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        # Sort by timestamp (most recent first)
-        df_sorted = df.sort_values(by='timestamp', ascending=False)
-        # Drop duplicates based on the URL, keeping the most recent entry
-        df_final = df_sorted.drop_duplicates(subset='asin', keep='first')
-        # Set the 'url' column as the index
-        df_final.set_index('asin', inplace=True)
-        
-        # If a specific URL is provided, return its data
-        if asin is not None:
-            # Check if the URL exists in the index
-            if asin in df_final.index:
-                return df_final.loc[asin, 'price']  # Returns a DataFrame with the URL's data
-            else:
-                return None
-          
-        return df_final
-    except FileNotFoundError:
+    """Load the previous price data from the price history."""
+    # Single product lookups are served from the in-memory latest-price index
+    if asin is not None:
+        return get_price_index().get(asin)
+    
+    df = get_history_store().read()
+    if df is None:
         return None
+    # Ensure timestamp is in datetime format
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    # Sort by timestamp (stable, so rows appended later win ties)
+    df_sorted = df.sort_values(by='timestamp', kind='stable')
+    # Drop duplicates based on the URL, keeping the most recent entry
+    df_final = df_sorted.drop_duplicates(subset='asin', keep='last')
+    # Set the 'url' column as the index
+    df_final.set_index('asin', inplace=True)
+
+    return df_final
 
-def write_csv(data):
+def notify_price_drops(rows):
+  """Compare a batch of scraped rows with the price history and return the price drops found."""
   try:
-    # Resolve the file path to an absolute path
-    log_file_path = os.path.abspath(LOG_FILE_PATH)
-    
-    # Get the directory from the file path and create the folder if it doesn't exist
-    directory = os.path.dirname(log_file_path)
-    os.makedirs(directory, exist_ok=True)  # Create folder if it doesn't exist
-        
-    df_new = pd.DataFrame(data)
-    df_new['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Set 'asin' as the index for new data
-    df_new.set_index('asin', inplace=True)
-
-    # Load existing data if file exists
-    try:
-        if os.path.exists(log_file_path):
-            df_existing = pd.read_csv(log_file_path, index_col='asin')
-            df = pd.concat([df_existing, df_new], axis=0, ignore_index=False)  # Append new data
-        else:
-            df = df_new  # If no file, create new one
-    except FileNotFoundError:
-        df = df_new  # If no file, create new one
-    except Exception as e:
-        logging.error(f"Error reading {LOG_FILE_PATH}: {e}")
-        return
-
-    # Save updated data
-    df.to_csv(LOG_FILE_PATH)
-    logging.info("CSV file updated successfully.")
+    with get_metrics().timer('price_drop_seconds'):
+      drops = detect_price_drops(rows)
   except Exception as e:
-    logging.error(f"Error writing to CSV: {e}")
+    logging.error(f"Error detecting price drops: {e}")
+    return None
+  if not drops.empty:
+    logging.info(f"{len(drops)} price drop(s) in a batch of {len(rows)} products.")
+  return drops
 
-def get_product_info(url: str) -> Dict:
-  """Extract product information from an Amazon product page."""
-  response = fetch_with_retries(url, headers=CUSTOM_HEADERS)
-  if response is None:
-        logging.error(f'Error in getting webpage: {url}')
-        return None
+def write_csv(data: Union[RecordBatch, List], digest: Optional[Digest] = None):
+  """
+  Append scraped records to the price history and notify the price drops among them (to `digest` when given,
+  see NotificationDispatcher.digest). Only the new rows are written.
+  Raises if the rows could not be stored, so the sink does not report them as written.
+  """
+  rows = data if isinstance(data, RecordBatch) else RecordBatch.from_records(data)
+  if not len(rows):
+    return
+  rows.stamp(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+  
+  # Drops are detected against the history before the batch becomes part of it
+  drops = notify_price_drops(rows)
+  try:
+    with get_metrics().timer('history_write_seconds'):
+      get_history_store().append(rows)
+      get_price_index().update(rows)
+  except Exception as e:
+    logging.error(f"Error writing price history: {e}")
+    raise
+  get_metrics().inc('history_rows_total', len(rows))
+  logging.info("Price history updated successfully.")
+  
+  # Notified once the batch is stored, so the price charts include the new prices
+  if drops is not None:
+    notifier = digest if digest is not None else get_dispatcher()
+    for drop in drops.itertuples(index=False):
+      try:
+        notifier.notify(drop.title, drop.previous_price, drop.price, drop.asin, drop.url, drop.reason)
+      except Exception as e:
+        logging.error(f"Error notifying the price drop of {drop.asin}: {e}")
 
-  soup = BeautifulSoup(response, 'lxml')
+def get_product_info(url: str, retry: Optional[RetryLater] = None, priority: int = 0) -> Optional[ProductRecord]:
+  """
+  Extract product information from an Amazon product page (`retry` resumes a deferred fetch, see run_pipeline,
+  and `priority` is the fetch's place in the per-host rate limiter queue).
+  """
+  # Failed fetches raise RetryLater so the pipeline retries them without blocking a worker,
+  # and FetchFailed once RETRY_MAX_ATTEMPTS attempts were made so the pipeline gives up on the URL
+  response = fetch_with_retries(url, headers=CUSTOM_HEADERS, max_retries=RETRY_MAX_ATTEMPTS, defer=True, retry=retry, priority=priority)
 
-  title_element = soup.select_one('#productTitle')
-  title = title_element.text.strip() if title_element else None
+  # Skip parsing and history writes when the title and price markup did not change since the last poll
+  fingerprints = get_price_fingerprints()
+  fingerprint = fingerprints.fingerprint(response)
+  if fingerprints.matches(url, fingerprint):
+    logging.info(f'Product page unchanged since last check: {url[:100]}')
+    return None
 
-  price_element = soup.select_one('span.a-offscreen')
-  price = None
-  if price_element:
-      try:
-          price = float(price_element.text.strip().replace('$', '').replace(',', ''))
-      except ValueError:
-          logging.error(f"Error parsing price for {title}")
-          return None
+  # Price drops are detected per batch when the records are written (see write_csv)
+  product_info = get_parse_pool().parse_product(response, url)
+  if product_info is not None:
+    # Remembered once parsed (crawl_frontier forgets it again if the record is not stored)
+    fingerprints.remember(url, fingerprint)
+  return product_info
 
-  rating_element = soup.select_one('#acrPopover')
-  rating_text = rating_element.attrs.get('title') if rating_element else None
-  rating = rating_text.replace('out of 5 stars', '') if rating_text else None
+def fetch_listing_page(listing_url: str, priority: int = 0) -> Optional[Tuple[List[str], Optional[str]]]:
+  """
+  Fetch one page of an Amazon listing (`priority` as in get_product_info).
 
-  image_element = soup.select_one('#landingImage')
-  image = image_element.attrs.get('src') if image_element else None
-  
-  asin = extract_asin(url)
-  
-  # Error handling for display_notification
-  if title is None or price is None or asin is None:
-    logging.error(f'Error in getting product title: {url}')
+  Returns:
+  - Tuple of the canonical product URLs on the page and the URL of the next page (None on the last page),
+    or None if the page could not be fetched.
+  """
+  response = fetch_with_retries(listing_url, headers = CUSTOM_HEADERS, priority = priority)
+  if response is None:
+    logging.error(f'Error in getting webpage: {listing_url}')
     return None
+  
+  # Parse product links and the next page link, then release the page
+  hrefs, next_href = get_parse_pool().parse_listing(response)
+  del response
+  next_page_url = urljoin(listing_url, next_href) if next_href else None
+  if next_page_url == listing_url:
+    next_page_url = None
+  return [canonicalize_product_url(urljoin(listing_url, href)) for href in hrefs], next_page_url
 
-  # Todo: check previous price and send notification if the price drops
-  # Load previous product data
-  previous_price = load_previous_price(asin)
-  if previous_price is not None:
-    if PRICE_DROP_MODE == 'value':
-        if price <= previous_price - PRICE_DROP_THRESHOLD:
-            logging.info("Price dropped by value threshold!")
-            display_notification(title, previous_price, price, asin, url)
-    elif PRICE_DROP_MODE == 'percentage':
-        if price <= previous_price * (1 - PRICE_DROP_THRESHOLD / 100):
-            logging.info("Price dropped by percentage threshold!")
-            display_notification(title, previous_price, price, asin, url)
+def fetch_batch_page(batch_url: str, priority: int = 0) -> Optional[Tuple[List[ProductRecord], List[str]]]:
+  """
+  Fetch a batch search page (see batch_search_url) and read the prices of its ASINs from the result cards
+  (`priority` as in get_product_info).
+
+  Returns:
+  - Tuple of the records of the requested ASINs found on the page and the product URLs of the requested
+    ASINs that were missing or ambiguous, or None if the page could not be fetched.
+  """
+  response = fetch_with_retries(batch_url, headers = CUSTOM_HEADERS, priority = priority)
+  if response is None:
+    logging.error(f'Error in getting webpage: {batch_url}')
+    return None
   
-  return {
-      'title': title,
-      'price': price,
-      'rating': rating,
-      'image': image,
-      'url': url,
-      'asin': asin,
-  }
+  records, ambiguous = get_parse_pool().parse_listing_cards(response, batch_url)
+  del response
+  # Search results can include other products (sponsored cards, other variations), keep the requested ones
+  requested = set(batch_search_asins(batch_url))
+  records = [record for record in records if record.asin in requested]
+  ambiguous = [asin for asin in ambiguous if asin in requested]
+  if ambiguous:
+    logging.info(f'Ambiguous result cards for {", ".join(ambiguous)}, fetching their product pages.')
+  found = {record.asin for record in records}
+  return records, [url for url in batch_product_urls(batch_url) if extract_asin(url) not in found]
 
-def parse_listing(listing_url: str, max_pages: int, current_page: int = 1, visited_urls: Optional[Set[str]] = None, visited_listing_urls: Optional[Set[str]] = None) -> None:
+def iter_listing_products(listing_url: str, max_pages: int, current_page: int = 1, visited_urls: Optional[Set[str]] = None, visited_listing_urls: Optional[Set[str]] = None, stats: Optional[Counter] = None) -> Iterator[str]:
   """
-  Parse an Amazon listing page to extract product URLs.
+  Walk the result pages of an Amazon listing and yield product URLs that have not been seen yet.
+
+  Pagination is iterative, and only the page currently being walked is kept in memory.
+  Product links are canonicalized to /dp/<ASIN>, so the same product is yielded once
+  no matter which tracking parameters its links carry.
 
   Parameters:
   - listing_url (str): The URL of the Amazon search results or listing page to parse.
@@ -165,83 +168,254 @@ def parse_listing(listing_url: str, max_pages: int, current_page: int = 1, visit
   - current_page (int, optional): The current page number in the search results, defaults to 1.
   - visited_urls (Optional[Set[str]], optional): A set of URLs that have already been scraped, used to avoid revisiting the same product pages. Defaults to None.
   - visited_listing_urls (Optional[Set[str]], optional): A set of listing URLs that have been visited to avoid re-processing them. Defaults to None.
+  - stats (Optional[Counter], optional): Counts product 'links' found and 'duplicates' skipped. Defaults to None.
 
-  Returns:
-  - None: This function does not return any value. It collects product information and writes it to a CSV file.
+  Yields:
+  - str: Canonical product page URLs in the order they appear on the listing pages.
   """
   if visited_urls is None:
       visited_urls = set()
   if visited_listing_urls is None:
       visited_listing_urls = set()
-      
-  if current_page > max_pages or listing_url in visited_listing_urls:
-    logging.info("searching ended because of max pages or visited urls")
-    return []
-  
-  visited_listing_urls.add(listing_url)
-  
-  # Fetch page content
-  response = fetch_with_retries(listing_url, headers = CUSTOM_HEADERS)
-  if response is None:
-    logging.error(f'Error in getting webpage: {listing_url}')
-    return []
+  if stats is None:
+      stats = Counter()
   
-  # Parse product links
-  soup_search = BeautifulSoup(response, 'lxml')
-  link_elements = soup_search.select('[data-cy="title-recipe"] > a.a-link-normal')
-  page_data = []
-  
-  # Process product pages
-  for link in link_elements:
-        full_url = urljoin(listing_url, link.attrs.get('href'))
-        if full_url not in visited_urls:
-            visited_urls.add(full_url)
-            logging.info(f'Scraping product from {full_url[:100]}', flush=True)
-            
-            # Get product info and store in memory temporarily
-            product_info = get_product_info(full_url)
-            if product_info:
-                page_data.append(product_info)
-            
-            # Add a delay to prevent Amazon blocking
-            time.sleep(CHECK_FREQUENCY)
+  while listing_url and current_page <= max_pages and listing_url not in visited_listing_urls:
+    visited_listing_urls.add(listing_url)
+    
+    page = fetch_listing_page(listing_url)
+    if page is None:
+      return
+    product_urls, next_page_url = page
+    
+    for full_url in product_urls:
+      stats['links'] += 1
+      if full_url in visited_urls:
+        stats['duplicates'] += 1
+        continue
+      visited_urls.add(full_url)
+      logging.info(f'Scraping product from {full_url[:100]}')
+      yield full_url
+    
+    if next_page_url is None:
+      return
+    logging.info(f'Scraping next page: {next_page_url}')
+    listing_url = next_page_url
+    current_page += 1
   
-  # write data to csv
-  write_csv(page_data)
-                
-  next_page_el = soup_search.select_one('a.s-pagination-next:not(.s-pagination-disabled)')
-  if next_page_el:
-      next_page_url = next_page_el.attrs.get('href')
-      next_page_url = urljoin(listing_url, next_page_url)
-      if next_page_url != listing_url:
+  logging.info("searching ended because of max pages or visited urls")
+
+def crawl_frontier(frontier: Frontier, max_pages: int = 0, stats: Optional[Counter] = None, priority: int = 0, digest: Optional[Digest] = None) -> int:
+  """
+  Work on a crawl run until its frontier has no queued or leased URL left.
+
+  Listing pages leased from the frontier are walked here: their product links and their
+  next page (up to max_pages) are added back to the frontier, which drops URLs already
+  part of the run. Batch search pages are read here too: the records of their result
+  cards go straight to the sink, and the product pages of the ASINs they did not show
+  are added to the frontier. Leased product pages are streamed to the fetch workers. A page
+  is completed once its record is written to the price history (or right away when it did
+  not change since the last check), and failed when its fetch or the write failed. Several nodes can run this on the same frontier, and a node started after
+  an interruption picks up the URLs that were not completed.
+
+  Parameters:
+  - frontier (Frontier): The frontier of the crawl run.
+  - max_pages (int, optional): The last listing page to follow. Defaults to 0 (product pages only).
+  - stats (Optional[Counter], optional): Counts product 'links' found, 'duplicates' skipped, products read
+    from 'batch_cards' and 'batch_fallbacks' fetched from their product page. Defaults to None.
+  - priority (int, optional): Place of the run's requests in the per-host rate limiter queue, ahead of the
+    requests of runs with a lower priority. Defaults to 0.
+  - digest (Optional[Digest], optional): Collects the price drops of the run. Defaults to None (each drop is notified on its own).
+
+  Returns:
+  - int: Number of products scraped by this node.
+  """
+  if stats is None:
+    stats = Counter()
+  owner = default_node_id()
+  # Product leases of this node that are not finished yet, by lease token
+  leased = {}
+  leased_changed = threading.Condition()
+  # Products are only leased while a worker can take them soon: a lease waiting too long in the
+  # local queue would expire, and another node (or this one) would fetch the product again
+  max_leased = 2 * FETCH_CONCURRENCY
+  # Records are completed in the frontier once written, so a batch is written before their leases expire
+  sink = BatchedSink(lambda rows: write_csv(rows, digest), batch_factory=RecordBatch, max_wait=FRONTIER_LEASE_SECONDS / 2)
+
+  def release(item: WorkItem):
+    with leased_changed:
+      leased.pop(item.token, None)
+      leased_changed.notify_all()
+
+  def finish(item: WorkItem, done: bool):
+    release(item)
+    if done:
+      frontier.complete(item)
+    else:
+      frontier.fail(item)
+
+  def finish_when_written(item: WorkItem, count: int):
+    """Return a sink callback finishing `item` once its `count` records were written."""
+    lock = threading.Lock()
+    state = {'left': count, 'written': True}
+    def written(ok: bool):
+      with lock:
+        state['left'] -= 1
+        state['written'] = state['written'] and ok
+        if state['left']:
+          return
+      if not state['written']:
+        # Fetch the page again on the next lease rather than skip it as unchanged
+        get_price_fingerprints().forget(item.url)
+      finish(item, state['written'])
+    return written
+
+  def leased_products() -> Iterator[WorkItem]:
+    while True:
+      listings = frontier.lease('listing', owner)
+      for item in listings:
+        page = fetch_listing_page(item.url, priority)
+        if page is None:
+          frontier.fail(item)
+          continue
+        product_urls, next_page_url = page
+        for url in product_urls:
+          stats['links'] += 1
+          if frontier.add('product', url):
+            logging.info(f'Scraping product from {url[:100]}')
+          else:
+            stats['duplicates'] += 1
+        if next_page_url and item.page < max_pages:
           logging.info(f'Scraping next page: {next_page_url}')
-          parse_listing(
-              next_page_url,
-              max_pages,
-              current_page + 1,
-              visited_urls,
-              visited_listing_urls
-          )
+          frontier.add('listing', next_page_url, item.page + 1)
+        frontier.complete(item)
+      
+      batches = frontier.lease('batch', owner)
+      for item in batches:
+        page = fetch_batch_page(item.url, priority)
+        if page is None:
+          # Check the products of the batch one by one rather than not at all
+          records, fallback_urls = [], batch_product_urls(item.url)
+        else:
+          records, fallback_urls = page
+        stats['batch_cards'] += len(records)
+        for url in fallback_urls:
+          if frontier.add('product', url):
+            stats['batch_fallbacks'] += 1
+        if records:
+          # Completed once the records of its result cards are written
+          on_written = finish_when_written(item, len(records))
+          for record in records:
+            sink.add(record, on_written)
+        else:
+          frontier.complete(item)
+      
+      with leased_changed:
+        free = max_leased - len(leased)
+      products = frontier.lease('product', owner, free) if free > 0 else []
+      for item in products:
+        with leased_changed:
+          leased[item.token] = item
+        yield item
+      
+      if not listings and not batches and not products:
+        with leased_changed:
+          fetching = bool(leased)
+        # Write the buffered records so their products are completed: all of them once
+        # nothing is fetched here anymore, otherwise the ones whose leases would expire
+        sink.flush(stale_only=fetching)
+        with leased_changed:
+          if len(leased) < max_leased:
+            # Stop once the only active URLs are the ones this node is still fetching
+            if free > 0 and frontier.active() <= len(leased):
+              return
+            if free <= 0:
+              continue  # A lease was finished meanwhile, take the next products right away
+          # Wake up as soon as a lease is finished, or poll for work added by other nodes
+          leased_changed.wait(FRONTIER_POLL_INTERVAL)
+
+  def scrape(item: WorkItem, retry: Optional[RetryLater] = None) -> None:
+    # A failed fetch raises FetchFailed, and the pipeline fails the item through on_failure
+    product_info = get_product_info(item.url, retry, priority)
+    if product_info is None:
+      # Unchanged since the last check (or not parsable), there is nothing to write
+      finish(item, done=True)
+      return None
+    # Make room for the next lease, the product is completed once its batch is written
+    release(item)
+    sink.add(product_info, finish_when_written(item, 1))
+    return None
+
+  return run_pipeline(
+      leased_products(),
+      scrape,
+      sink,
+      on_failure=lambda item: finish(item, done=False),
+  )
+
+def parse_listing(listing_url: str, max_pages: int, current_page: int = 1, visited_urls: Optional[Set[str]] = None, visited_listing_urls: Optional[Set[str]] = None) -> None:
+  """
+  Scrape every product of an Amazon listing and append it to the price history.
+
+  Product URLs are streamed from iter_listing_products to the fetch workers, and the
+  scraped records are written in batches of HISTORY_BATCH_SIZE.
+
+  Parameters:
+  - Same as iter_listing_products.
+
+  Returns:
+  - None: This function does not return any value. It collects product information and writes it to the price history.
+  """
+  sink = BatchedSink(write_csv, batch_factory=RecordBatch)
+  run_pipeline(
+      iter_listing_products(listing_url, max_pages, current_page, visited_urls, visited_listing_urls),
+      get_product_info,
+      sink,
+  )
 
 
 class Amazon:
 
   @staticmethod
-  def search(query:  Union[str, List[str]], max_pages: int = 50) -> None:
-    data = []
-  
+  def search(query:  Union[str, List[str]], max_pages: int = 50, run_id: Optional[str] = None) -> Dict[str, int]:
+    if isinstance(query, str):
+      query = [query]
+    
+    # The queries are crawled through a frontier: listing pages feed the fetch workers,
+    # and scraped records are appended to the history in batches.
+    # Products are deduplicated by ASIN across all queries, and nodes sharing the
+    # frontier split the pages of the run between them.
+    frontier = get_frontier(run_id or f"search-{datetime.now():%Y-%m-%d}")
     for item in query:
-      parse_listing(f'https://www.amazon.com/s?k={item}', max_pages = max_pages)
-  
-    return data
+      frontier.add('listing', f'{AMAZON_BASE_URL}/s?k={item}')
+    stats = Counter()
+    with get_dispatcher().digest() as digest:
+      stats['scraped'] = crawl_frontier(frontier, max_pages, stats, digest=digest)
+    logging.info(f"Search finished: {stats['scraped']} products scraped for {len(query)} queries, {stats['duplicates']} of {stats['links']} product links skipped as duplicate ASINs.")
+    return dict(stats)
   
   @staticmethod
-  def get_product(urls: Union[str, List[str]]) -> Dict:
-    data = []
-  
-    for item in urls:
-      data.append(get_product_info(item))
+  def get_product(urls: Union[str, List[str]], run_id: Optional[str] = None) -> Dict:
+    if isinstance(urls, str):
+      urls = [urls]
     
-    # write data to csv
-    write_csv(data)
-    
\ No newline at end of file
+    # Fetch each product once per check, whatever tracking parameters its watchlist URL carries.
+    # Nodes checking the same watchlist in the same CHECK_FREQUENCY window share one run.
+    # Its requests go ahead of the search crawl's in the per-host rate limiter queue.
+    frontier = get_frontier(run_id or f"watchlist-{int(time.time() // CHECK_FREQUENCY)}")
+    urls = [canonicalize_product_url(url) for url in urls]
+    if WATCHLIST_BATCH_MODE:
+      # One search per WATCHLIST_BATCH_SIZE products; crawl_frontier falls back to the
+      # product page of the products their search did not show unambiguously.
+      batch_urls, urls = batch_search_urls(urls, WATCHLIST_BATCH_SIZE)
+      for url in batch_urls:
+        frontier.add('batch', url)
+    for url in urls:
+      frontier.add('product', url)
+  
+    stats = Counter()
+    with get_dispatcher().digest() as digest:
+      stats['scraped'] = crawl_frontier(frontier, stats=stats, priority=WATCHLIST_FETCH_PRIORITY, digest=digest)
+    if WATCHLIST_BATCH_MODE:
+      logging.info(f"Watchlist checked: {stats['batch_cards']} products read from search results, {stats['batch_fallbacks']} fetched from their product page.")
+    return dict(stats)
@@ -0,0 +1,98 @@
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import pandas as pd
+from logs import logger
+from config import COMPACTION_RAW_DAYS, COMPACTION_HOURLY_DAYS, COMPACTION_RETENTION_DAYS
+from .history_store import HistoryStore, get_history_store
+from .metrics import get_metrics
+from .price_index import get_price_index
+
+
+def run_length_encode(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop the rows in the middle of runs of unchanged prices.
+
+    `df` must be sorted by ASIN, then time. The first and last row of every
+    run are kept, so the latest price, the lowest price since any time and
+    the shape of the price chart are the same as with every row.
+    """
+    asin, price = df['asin'], df['price']
+    same_as_previous = (asin == asin.shift(1)) & (price == price.shift(1))
+    same_as_next = (asin == asin.shift(-1)) & (price == price.shift(-1))
+    return df[~(same_as_previous & same_as_next)]
+
+
+def rollup(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """
+    Keep the lowest, highest and last row of every ASIN per time bucket.
+
+    Parameters:
+    - df: Rows sorted by ASIN, then time
+    - freq: Bucket size as a pandas frequency ('h' for hourly, 'D' for daily)
+
+    Returns:
+    - The kept rows, in their original order
+    """
+    if df.empty:
+        return df
+    buckets = pd.to_datetime(df['timestamp']).dt.floor(freq)
+    keep = set(df.groupby([df['asin'], buckets], sort=False).tail(1).index)
+    priced = df['price'].notna()
+    if priced.any():
+        prices = df.loc[priced, 'price'].groupby([df.loc[priced, 'asin'], buckets[priced]], sort=False)
+        keep.update(prices.idxmin())
+        keep.update(prices.idxmax())
+    return df[df.index.isin(keep)]
+
+
+def compact_frame(df: pd.DataFrame, now: Optional[datetime] = None, raw_days: float = COMPACTION_RAW_DAYS,
+                  hourly_days: float = COMPACTION_HOURLY_DAYS, retention_days: Optional[float] = COMPACTION_RETENTION_DAYS) -> pd.DataFrame:
+    """
+    Compact price history rows.
+
+    Rows older than `retention_days` are dropped, rows older than `hourly_days`
+    are rolled up per day and rows older than `raw_days` per hour. Then runs of
+    unchanged prices are reduced to their first and last row. The latest row of
+    every ASIN always survives, so the latest prices do not change.
+
+    Returns:
+    - The remaining rows in time order
+    """
+    now = now or datetime.now()
+    df = df.sort_values(by=['asin', 'timestamp'], kind='stable').reset_index(drop=True)
+    times = pd.to_datetime(df['timestamp'])
+    latest = ~df['asin'].duplicated(keep='last')
+    if retention_days is not None:
+        kept = (times >= now - timedelta(days=retention_days)) | latest
+        df, times = df[kept], times[kept]
+
+    daily = times < now - timedelta(days=hourly_days)
+    hourly = (times < now - timedelta(days=raw_days)) & ~daily
+    df = pd.concat([rollup(df[daily], 'D'), rollup(df[hourly], 'h'), df[~daily & ~hourly]]).sort_index()
+    df = run_length_encode(df)
+    return df.sort_values(by='timestamp', kind='stable')
+
+
+def compact_history(store: Optional[HistoryStore] = None, now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Compact the price history in place (see compact_frame) and reset the latest-price index.
+
+    Returns:
+    - Number of rows before and after the compaction
+    """
+    store = store or get_history_store()
+    start = time.perf_counter()
+    before, after = store.rewrite(lambda df: compact_frame(df, now))
+    # Rebuilt from the compacted history on the next lookup
+    get_price_index().invalidate()
+    elapsed = time.perf_counter() - start
+    get_metrics().observe('compaction_seconds', elapsed)
+    get_metrics().inc('compaction_rows_removed_total', before - after)
+    logger.info(f"Compacted price history from {before} to {after} rows in {elapsed:.1f} sec.")
+    return {'before': before, 'after': after}
+
+
+if __name__ == "__main__":
+    result = compact_history()
+    print(f"Compacted {result['before']} rows into {result['after']}.")
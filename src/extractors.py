@@ -0,0 +1,247 @@
+import lxml.html
+from lxml import etree
+from typing import Dict, List, Optional, Tuple
+from logs import logger
+from config import PARSER_ENGINE
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # selectolax is optional
+    HTMLParser = None
+
+# Size of the chunks fed to the incremental lxml parser
+CHUNK_SIZE = 64 * 1024
+
+# XPath equivalents of the CSS selectors used for listing pages
+_TITLE_LINKS_XPATH = '//*[@data-cy="title-recipe"]/a[contains(concat(" ", normalize-space(@class), " "), " a-link-normal ")]/@href'
+_NEXT_PAGE_XPATH = (
+    '//a[contains(concat(" ", normalize-space(@class), " "), " s-pagination-next ")'
+    ' and not(contains(concat(" ", normalize-space(@class), " "), " s-pagination-disabled "))]/@href'
+)
+
+_LISTING_LINKS_SELECTOR = '[data-cy="title-recipe"] > a.a-link-normal'
+_NEXT_PAGE_SELECTOR = 'a.s-pagination-next:not(.s-pagination-disabled)'
+
+# Product page blocks showing the price to pay (the apex block and the buy box). Elsewhere on the page,
+# carousels, other sellers and variations show prices of their own
+_PRICE_BLOCK_IDS = frozenset(('corePriceDisplay_desktop_feature_div', 'corePrice_desktop', 'corePrice_feature_div', 'apex_desktop'))
+# Struck-through list prices are marked with data-a-strike (the price to pay can be a-text-price too)
+_PRODUCT_PRICE_SELECTOR = 'span.a-price:not([data-a-strike="true"]) > span.a-offscreen'
+_PRODUCT_PRICE_SELECTORS = (
+    ', '.join(f'#{block_id} {_PRODUCT_PRICE_SELECTOR}' for block_id in sorted(_PRICE_BLOCK_IDS)),
+    _PRODUCT_PRICE_SELECTOR,
+    'span.a-offscreen',
+)
+
+# Result cards of a listing page and their fields (struck-through list prices are a-text-price)
+_CARD_SELECTOR = '[data-component-type="s-search-result"][data-asin]'
+_CARD_TITLE_SELECTOR = '[data-cy="title-recipe"] h2'
+_CARD_PRICE_SELECTOR = 'span.a-price:not(.a-text-price) > span.a-offscreen'
+_CARD_RATING_SELECTOR = 'span.a-icon-alt'
+_CARD_IMAGE_SELECTOR = 'img.s-image'
+
+# XPath equivalents of the card selectors
+_CARDS_XPATH = '//*[@data-component-type="s-search-result"][@data-asin]'
+_CARD_TITLE_XPATH = './/*[@data-cy="title-recipe"]//h2'
+_CARD_PRICE_XPATH = (
+    './/span[contains(concat(" ", normalize-space(@class), " "), " a-price ")'
+    ' and not(contains(concat(" ", normalize-space(@class), " "), " a-text-price "))]'
+    '/span[contains(concat(" ", normalize-space(@class), " "), " a-offscreen ")]'
+)
+_CARD_RATING_XPATH = './/span[contains(concat(" ", normalize-space(@class), " "), " a-icon-alt ")]'
+_CARD_IMAGE_XPATH = './/img[contains(concat(" ", normalize-space(@class), " "), " s-image ")]/@src'
+
+
+def _has_class(element, name: str) -> bool:
+    return name in (element.get('class') or '').split()
+
+
+def _price_rank(element) -> int:
+    """Rank an a-offscreen price like _PRODUCT_PRICE_SELECTORS: 0 in a price block, 1 elsewhere, 2 struck through or loose."""
+    parent = element.getparent()
+    if parent is None or parent.tag != 'span' or not _has_class(parent, 'a-price') or parent.get('data-a-strike') == 'true':
+        return 2
+    return 0 if any(ancestor.get('id') in _PRICE_BLOCK_IDS for ancestor in parent.iterancestors()) else 1
+
+
+def _product_with_lxml(html: str) -> Dict[str, Optional[str]]:
+    """Parse a product page incrementally and stop as soon as every field has been found."""
+    fields = {'title': None, 'price': None, 'rating': None, 'image': None}
+    # Rank of the price found so far (see _price_rank), the page is read until a price block price is found
+    price_rank = 3
+    parser = etree.HTMLPullParser(events=('end',))
+    for offset in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[offset:offset + CHUNK_SIZE])
+        for _, element in parser.read_events():
+            element_id = element.get('id')
+            if element_id == 'productTitle':
+                fields['title'] = ''.join(element.itertext())
+            elif element_id == 'acrPopover':
+                fields['rating'] = element.get('title')
+            elif element_id == 'landingImage':
+                fields['image'] = element.get('src')
+            elif price_rank and element.tag == 'span' and _has_class(element, 'a-offscreen'):
+                rank = _price_rank(element)
+                if rank < price_rank:
+                    fields['price'] = ''.join(element.itertext())
+                    price_rank = rank
+        if fields['title'] is not None and price_rank == 0 and fields['rating'] is not None and fields['image'] is not None:
+            break
+    return fields
+
+
+def _product_with_selectolax(html: str) -> Dict[str, Optional[str]]:
+    tree = HTMLParser(html)
+    title = tree.css_first('#productTitle')
+    price = next(filter(None, (tree.css_first(selector) for selector in _PRODUCT_PRICE_SELECTORS)), None)
+    rating = tree.css_first('#acrPopover')
+    image = tree.css_first('#landingImage')
+    return {
+        'title': title.text() if title else None,
+        'price': price.text() if price else None,
+        'rating': rating.attributes.get('title') if rating else None,
+        'image': image.attributes.get('src') if image else None,
+    }
+
+
+def _product_with_bs4(html: str) -> Dict[str, Optional[str]]:
+    # BeautifulSoup is only loaded when the bs4 engine is used
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'lxml')
+    title = soup.select_one('#productTitle')
+    price = next(filter(None, (soup.select_one(selector) for selector in _PRODUCT_PRICE_SELECTORS)), None)
+    rating = soup.select_one('#acrPopover')
+    image = soup.select_one('#landingImage')
+    return {
+        'title': title.text if title else None,
+        'price': price.text if price else None,
+        'rating': rating.attrs.get('title') if rating else None,
+        'image': image.attrs.get('src') if image else None,
+    }
+
+
+def _listing_with_lxml(html: str) -> Tuple[List[str], Optional[str]]:
+    tree = lxml.html.fromstring(html)
+    next_page = tree.xpath(_NEXT_PAGE_XPATH)
+    return [str(href) for href in tree.xpath(_TITLE_LINKS_XPATH)], str(next_page[0]) if next_page else None
+
+
+def _listing_with_selectolax(html: str) -> Tuple[List[str], Optional[str]]:
+    tree = HTMLParser(html)
+    next_page = tree.css_first(_NEXT_PAGE_SELECTOR)
+    hrefs = [link.attributes.get('href') for link in tree.css(_LISTING_LINKS_SELECTOR)]
+    return hrefs, next_page.attributes.get('href') if next_page else None
+
+
+def _listing_with_bs4(html: str) -> Tuple[List[str], Optional[str]]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'lxml')
+    next_page = soup.select_one(_NEXT_PAGE_SELECTOR)
+    hrefs = [link.attrs.get('href') for link in soup.select(_LISTING_LINKS_SELECTOR)]
+    return hrefs, next_page.attrs.get('href') if next_page else None
+
+
+def _cards_with_lxml(html: str) -> List[Dict[str, Optional[str]]]:
+    tree = lxml.html.fromstring(html)
+    cards = []
+    for card in tree.xpath(_CARDS_XPATH):
+        title = card.xpath(_CARD_TITLE_XPATH)
+        price = card.xpath(_CARD_PRICE_XPATH)
+        rating = card.xpath(_CARD_RATING_XPATH)
+        image = card.xpath(_CARD_IMAGE_XPATH)
+        cards.append({
+            'asin': card.get('data-asin'),
+            'title': title[0].text_content() if title else None,
+            'price': price[0].text_content() if price else None,
+            'rating': rating[0].text_content() if rating else None,
+            'image': str(image[0]) if image else None,
+        })
+    return cards
+
+
+def _cards_with_selectolax(html: str) -> List[Dict[str, Optional[str]]]:
+    cards = []
+    for card in HTMLParser(html).css(_CARD_SELECTOR):
+        title = card.css_first(_CARD_TITLE_SELECTOR)
+        price = card.css_first(_CARD_PRICE_SELECTOR)
+        rating = card.css_first(_CARD_RATING_SELECTOR)
+        image = card.css_first(_CARD_IMAGE_SELECTOR)
+        cards.append({
+            'asin': card.attributes.get('data-asin'),
+            'title': title.text() if title else None,
+            'price': price.text() if price else None,
+            'rating': rating.text() if rating else None,
+            'image': image.attributes.get('src') if image else None,
+        })
+    return cards
+
+
+def _cards_with_bs4(html: str) -> List[Dict[str, Optional[str]]]:
+    from bs4 import BeautifulSoup
+    cards = []
+    for card in BeautifulSoup(html, 'lxml').select(_CARD_SELECTOR):
+        title = card.select_one(_CARD_TITLE_SELECTOR)
+        price = card.select_one(_CARD_PRICE_SELECTOR)
+        rating = card.select_one(_CARD_RATING_SELECTOR)
+        image = card.select_one(_CARD_IMAGE_SELECTOR)
+        cards.append({
+            'asin': card.attrs.get('data-asin'),
+            'title': title.text if title else None,
+            'price': price.text if price else None,
+            'rating': rating.text if rating else None,
+            'image': image.attrs.get('src') if image else None,
+        })
+    return cards
+
+
+# Product page, listing page and listing card extractors of every engine
+ENGINES = {
+    'lxml': (_product_with_lxml, _listing_with_lxml, _cards_with_lxml),
+    'selectolax': (_product_with_selectolax, _listing_with_selectolax, _cards_with_selectolax),
+    'bs4': (_product_with_bs4, _listing_with_bs4, _cards_with_bs4),
+}
+
+
+# Engines we already warned about, so the fallback is only logged once
+_warned_engines = set()
+
+
+def resolve_engine(engine: Optional[str] = None) -> str:
+    """Return the engine to use, falling back to BeautifulSoup when the requested one is unavailable."""
+    engine = engine or PARSER_ENGINE
+    if engine in ENGINES and (engine != 'selectolax' or HTMLParser is not None):
+        return engine
+    if engine not in _warned_engines:
+        _warned_engines.add(engine)
+        logger.warning(f"Parser engine '{engine}' is not available. Falling back to bs4.")
+    return 'bs4'
+
+
+def extract_product(html: str, engine: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """
+    Extract the raw text of the product fields from a product page.
+
+    Returns:
+    - Dict with 'title', 'price', 'rating' and 'image' (None for fields that are missing)
+    """
+    return ENGINES[resolve_engine(engine)][0](html)
+
+
+def extract_listing(html: str, engine: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+    """
+    Extract the product links and the next page link from a listing page.
+
+    Returns:
+    - Tuple of (product hrefs, next page href or None)
+    """
+    return ENGINES[resolve_engine(engine)][1](html)
+
+
+def extract_listing_cards(html: str, engine: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
+    """
+    Extract the result cards of a listing page.
+
+    Returns:
+    - One dict per card with 'asin', 'title', 'price', 'rating' and 'image' (None for fields that are missing)
+    """
+    return ENGINES[resolve_engine(engine)][2](html)
@@ -1,94 +1,148 @@
-import requests
 import time
-import random
-from datetime import datetime, timedelta
 from requests.exceptions import ConnectionError, Timeout, RequestException, HTTPError
 from logs import logger
-from config import USER_AGENTS
+from .rate_limiter import get_rate_limiter
+from .sessions import get_session_pool
+from .response_cache import get_response_cache
+from .identity import get_identity_scheduler
+from .retry_scheduler import FetchFailed, RetryLater, get_retry_scheduler, parse_retry_after
+from .metrics import get_metrics
 
-# Dictionary to track banned User-Agents and the time they were banned
-BANNED_USER_AGENTS = {}
-
-# User-Agent Ban duration (e.g., 5 minutes)
-BAN_DURATION = timedelta(minutes=5)
-
-# List of possible User-Agent headers
-USER_AGENTS = USER_AGENTS
-
-def fetch_with_retries(url, headers=None, max_retries=3, backoff_factor=5, timeout=10):
+def fetch_with_retries(url, headers=None, max_retries=3, backoff_factor=5, timeout=10, use_cache=True, defer=False, retry=None, priority=0):
     """
     Fetch a URL with retries.
 
     Parameters:
     - url: URL to fetch
     - max_retries: Maximum number of retries
-    - backoff_factor: Seconds to wait between retries (exponential backoff)
+    - backoff_factor: Base of the exponential backoff between retries, in seconds
     - timeout: Timeout for each request
+    - use_cache: Serve fresh responses from the response cache and revalidate stale ones
+    - defer: Instead of sleeping before a retry, raise RetryLater so the caller can fetch something else meanwhile,
+      and raise FetchFailed instead of returning None when giving up
+    - retry: The RetryLater raised by the previous deferred attempt, to resume from it
+    - priority: Requests with a higher priority are let through the per-host rate limiter first
     
     Returns:
-    - Response content
+    - Response content, or None if the fetch failed (and `defer` is False)
     """
     
-    previous_user_agent = None  # Track the previous User-Agent to avoid repetition
+    # Track the previous identity to avoid repetition (a resumed fetch starts where the deferred one stopped)
+    previous_identity = retry.identity if retry is not None else None
+    first_attempt = retry.next_attempt if retry is not None else 0
+    scheduler = get_identity_scheduler()
+    retries = get_retry_scheduler()
+    metrics = get_metrics()
     
-    for attempt in range(max_retries):
+    cache = get_response_cache() if use_cache else None
+    if cache is not None:
+        body = cache.get_fresh(url)
+        if body is not None:
+            metrics.inc('fetch_cache_hits_total', result='fresh')
+            logger.info(f"Served {url} from the response cache")
+            return body
+    
+    # Cleared when a 304 arrives for a page that is no longer cached
+    conditional = True
+    attempt = first_attempt
+    while attempt < max_retries:
+        retry_after = None
         try:
-            # If no headers are provided, use an empty dict
-            if headers is None:
-                headers = {}
+            # Copy the headers so concurrent callers and later attempts never share the User-Agent slot or validators
+            request_headers = dict(headers or {})
+            if cache is not None and conditional:
+                request_headers.update(cache.conditional_headers(url))
               
-            # Select a random User-Agent that is not banned or previously used
-            available_agents = [agent for agent in USER_AGENTS if agent != previous_user_agent and not is_banned(agent)]
-            if not available_agents:
-                logger.error("All User-Agents have been banned. Cannot proceed.")
-                return None
+            # Don't send anything while the host's circuit breaker is open
+            circuit_delay, probe = retries.before_request(url)
+            if circuit_delay:
+                logger.warning(f"Circuit open for {url}. Retrying in {circuit_delay:.1f} sec...")
+                if defer:
+                    # No request was made, so the attempt is not used up
+                    raise RetryLater(circuit_delay, attempt, previous_identity, charged=False)
+                time.sleep(circuit_delay)
+                continue  # Waiting for the circuit does not use up an attempt
             
-            user_agent = random.choice(available_agents)
-            headers["User-Agent"] = user_agent
+            # Take the identity whose cooldown expired first, skipping the previous one
+            identity = scheduler.acquire(exclude=previous_identity)
+            if identity is None:
+                logger.error("All User-Agents are cooling down. Cannot proceed.")
+                if probe:
+                    retries.cancel_probe(url)
+                break
+            previous_identity = identity
+            request_headers["User-Agent"] = identity.user_agent
             
-            response = requests.get(url, headers=headers, timeout=timeout)
+            # Wait for the per-host politeness budget before hitting the server
+            get_rate_limiter().acquire(url, priority)
+            started = time.monotonic()
+            response = None
+            try:
+                response = get_session_pool().get(url, identity.user_agent, headers=request_headers, timeout=timeout, proxy=identity.proxy)
+            finally:
+                # Every request that was let through reports back to the circuit breaker
+                retries.record_result(url, unavailable=response is not None and response.status_code == 503, probe=probe)
+                metrics.observe('fetch_seconds', time.monotonic() - started)
+                metrics.inc('fetch_requests_total', status=response.status_code if response is not None else 'error')
+            if response.status_code == 304:
+                scheduler.report_success(identity, time.monotonic() - started)
+                body = cache.revalidated(url) if cache is not None and conditional else None
+                if body is not None:
+                    metrics.inc('fetch_cache_hits_total', result='revalidated')
+                    logger.info(f"{url} not modified, using the cached response")
+                    return body
+                if not conditional:
+                    logger.error(f"{url} answered 304 to an unconditional request. Not retrying.")
+                    break
+                # The cached body is gone: drop its validators and ask for the whole page
+                logger.warning(f"{url} not modified but no longer cached, fetching it again")
+                if cache is not None:
+                    cache.forget(url)
+                conditional = False
+                continue  # The request succeeded, so the attempt is not used up
             response.raise_for_status() # Raise error for HTTP failures
+            scheduler.report_success(identity, time.monotonic() - started)
+            metrics.inc('fetch_bytes_total', len(response.content))
             
-            # Update the previous User-Agent for the next attempt
-            previous_user_agent = user_agent
+            # Only complete pages are worth revalidating later
+            if cache is not None and response.status_code == 200:
+                cache.store(url, response.text, response.headers)
             
             logger.info(f"Successfully fetched {url}")
-            print(f"Successfully fetched {url}")
             return response.text # Return response content
           
         except Timeout:
-            logger.warning(f"Timeout on attempt {attempt + 1}. Retrying in {backoff_factor * (attempt + 1)} sec...")
+            logger.warning(f"Timeout on attempt {attempt + 1}.")
+            scheduler.report_failure(identity)
         except HTTPError as e:
             if response.status_code == 503:
-                logger.warning(f"503 Service Unavailable on attempt {attempt + 1}. Retrying in {backoff_factor * (attempt + 1)} sec...")
-                # Mark this User-Agent as banned temporarily
-                ban_user_agent(user_agent)
+                logger.warning(f"503 Service Unavailable on attempt {attempt + 1}.")
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                # Put this identity on cooldown
+                metrics.inc('fetch_bans_total')
+                scheduler.report_failure(identity, banned=True, retry_after=retry_after)
             else:
                 logger.error(f"HTTP error {e.response.status_code}. Not retrying.")
                 break  # Exit on other HTTP errors
         except (ConnectionError, RequestException) as e:
-            logger.warning(f"Request failed: {e}. Retrying in {backoff_factor * (attempt + 1)} sec...")
+            logger.warning(f"Request failed: {e}.")
+            scheduler.report_failure(identity)
         
-        time.sleep(backoff_factor * (attempt + 1))  # Exponential backoff
+        if attempt + 1 >= max_retries:
+            break
+        if not retries.try_retry(url):
+            logger.error(f"Retry budget exhausted, giving up on {url}.")
+            break
+        metrics.inc('fetch_retries_total')
+        delay = retries.backoff(attempt, backoff_factor, retry_after)
+        if defer:
+            raise RetryLater(delay, attempt + 1, previous_identity)
+        logger.warning(f"Retrying {url} in {delay:.1f} sec...")
+        time.sleep(delay)  # Exponential backoff
+        attempt += 1
     
-    logger.error(f"Failed to fetch URL: {url}. Max retries exceeded.")
+    metrics.inc('fetch_failures_total')
+    logger.error(f"Failed to fetch URL: {url}.")
+    if defer:
+        raise FetchFailed(url)
     return None
-
-def is_banned(user_agent):
-    """Check if the User-Agent is banned or can be retried."""
-    if user_agent in BANNED_USER_AGENTS:
-        ban_time = BANNED_USER_AGENTS[user_agent]
-        if datetime.now() - ban_time >= BAN_DURATION:
-            # If enough time has passed, remove from banned list and allow retry
-            logger.info(f"User-Agent {user_agent} can be retried after ban duration.")
-            del BANNED_USER_AGENTS[user_agent]
-            return False
-        else:
-            logger.warning(f"User-Agent {user_agent} is still banned. Try later.")
-            return True
-    return False
-
-def ban_user_agent(user_agent):
-    """Ban a User-Agent temporarily and record the ban time."""
-    logger.warning(f"Banning User-Agent {user_agent} due to 503 error.")
-    BANNED_USER_AGENTS[user_agent] = datetime.now()
\ No newline at end of file
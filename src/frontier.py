@@ -0,0 +1,355 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import List
+from logs import logger
+from config import (
+    FRONTIER_BACKEND,
+    FRONTIER_PATH,
+    FRONTIER_REDIS_URL,
+    FRONTIER_LEASE_SECONDS,
+    FRONTIER_MAX_LEASES,
+    FRONTIER_RETENTION,
+    NODE_ID,
+)
+
+try:
+    import redis
+except ImportError:  # The Redis backend is optional
+    redis = None
+
+
+def default_node_id() -> str:
+    """Identify this scraper process in work leases."""
+    return NODE_ID or f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkItem:
+    """A listing page or product page to crawl."""
+
+    __slots__ = ('url', 'kind', 'page', 'token')
+
+    def __init__(self, url: str, kind: str, page: int = 1, token=None):
+        self.url = url
+        self.kind = kind
+        self.page = page
+        # Backend specific handle of the lease, unique per lease (the same URL leased again gets a new token)
+        self.token = token
+
+    def __str__(self):
+        return self.url
+
+
+class Frontier:
+    """
+    Persistent crawl frontier shared by the scraper nodes working on one run.
+
+    Every URL is added once per run (later adds are ignored), handed out
+    under a lease, and stays active until it is completed or failed. Leases
+    that expire because a node died are handed out again, so every item is
+    processed at least once. An item leased FRONTIER_MAX_LEASES times
+    without completing is marked as failed. An item completed under an
+    expired lease is done: it is not handed out again, even if it was
+    already queued again.
+    """
+
+    def add(self, kind: str, url: str, page: int = 1) -> bool:
+        """Queue a URL. Returns False if the URL was already part of the run."""
+        raise NotImplementedError
+
+    def lease(self, kind: str, owner: str, limit: int = 1) -> List[WorkItem]:
+        """Lease up to `limit` queued items of a kind."""
+        raise NotImplementedError
+
+    def complete(self, item: WorkItem) -> None:
+        raise NotImplementedError
+
+    def fail(self, item: WorkItem) -> None:
+        raise NotImplementedError
+
+    def active(self) -> int:
+        """Return the number of items that are queued or leased."""
+        raise NotImplementedError
+
+
+class MemoryFrontier(Frontier):
+    """In-process frontier (no resumability, no sharing between nodes)."""
+
+    def __init__(self, lease_seconds: float = FRONTIER_LEASE_SECONDS, max_leases: int = FRONTIER_MAX_LEASES):
+        self.lease_seconds = lease_seconds
+        self.max_leases = max_leases
+        self._items = {}
+        self._queues = {}
+        self._leased = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, url, page=1):
+        with self._lock:
+            if url in self._items:
+                return False
+            self._items[url] = {'kind': kind, 'page': page, 'leases': 0, 'state': 'queued'}
+            self._queues.setdefault(kind, []).append(url)
+            return True
+
+    def _requeue_expired(self, now):
+        for url, expires in list(self._leased.items()):
+            if expires <= now:
+                del self._leased[url]
+                item = self._items[url]
+                if item['state'] != 'leased':
+                    continue
+                if item['leases'] >= self.max_leases:
+                    item['state'] = 'failed'
+                else:
+                    item['state'] = 'queued'
+                    self._queues[item['kind']].append(url)
+
+    def lease(self, kind, owner, limit=1):
+        now = time.time()
+        leased = []
+        with self._lock:
+            self._requeue_expired(now)
+            queue = self._queues.get(kind, [])
+            while queue and len(leased) < limit:
+                url = queue.pop(0)
+                item = self._items[url]
+                if item['state'] != 'queued':
+                    continue  # Finished under an expired lease after it was queued again
+                item['state'] = 'leased'
+                item['leases'] += 1
+                self._leased[url] = now + self.lease_seconds
+                leased.append(WorkItem(url, kind, item['page'], token=(url, item['leases'])))
+        return leased
+
+    def _finish(self, item, state):
+        with self._lock:
+            self._leased.pop(item.url, None)
+            entry = self._items[item.url]
+            # A stale lease failing never undoes a completion
+            if entry['state'] != 'done':
+                entry['state'] = state
+
+    def complete(self, item):
+        self._finish(item, 'done')
+
+    def fail(self, item):
+        self._finish(item, 'failed')
+
+    def active(self):
+        with self._lock:
+            return sum(1 for item in self._items.values() if item['state'] in ('queued', 'leased'))
+
+
+# Seconds between two purges of the runs older than the retention period
+_SQLITE_PURGE_INTERVAL = 3600
+
+# Open SQLite frontier databases of this process, by path: [connection, lock, time of the last purge]
+_sqlite_databases = {}
+_sqlite_databases_lock = threading.Lock()
+
+
+def _sqlite_database(path: str, retention: float):
+    """
+    Return the connection to a frontier database and the lock serializing its use.
+
+    The connection is opened (and the schema created) once per process, and shared by
+    the frontiers of every run in the file. Runs older than `retention` are purged when
+    the database is opened, then at most once per _SQLITE_PURGE_INTERVAL.
+    """
+    with _sqlite_databases_lock:
+        database = _sqlite_databases.get(path)
+        if database is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS frontier ('
+                'run TEXT NOT NULL, url TEXT NOT NULL, kind TEXT NOT NULL, page INTEGER, '
+                "state TEXT NOT NULL DEFAULT 'queued', owner TEXT, lease_expires REAL, "
+                'leases INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, PRIMARY KEY (run, url))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_frontier_state ON frontier (run, kind, state)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_frontier_created ON frontier (created)')
+            database = _sqlite_databases[path] = [conn, threading.Lock(), 0.0]
+        conn, lock, purged = database
+        now = time.time()
+        purge = now - purged >= _SQLITE_PURGE_INTERVAL
+        if purge:
+            database[2] = now
+    if purge:
+        with lock:
+            # Forget runs older than the retention period
+            conn.execute('DELETE FROM frontier WHERE created < ?', (now - retention,))
+    return conn, lock
+
+
+class SqliteFrontier(Frontier):
+    """Frontier in a SQLite file, shared by the scraper processes that can reach the file."""
+
+    def __init__(self, run: str, path: str = FRONTIER_PATH, lease_seconds: float = FRONTIER_LEASE_SECONDS,
+                 max_leases: int = FRONTIER_MAX_LEASES, retention: float = FRONTIER_RETENTION):
+        self.run = run
+        self.path = os.path.abspath(path)
+        self.lease_seconds = lease_seconds
+        self.max_leases = max_leases
+        self._conn, self._lock = _sqlite_database(self.path, retention)
+
+    def add(self, kind, url, page=1):
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO frontier (run, url, kind, page, created) VALUES (?, ?, ?, ?, ?)',
+                (self.run, url, kind, page, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def lease(self, kind, owner, limit=1):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so two nodes never lease the same rows
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    "UPDATE frontier SET state = CASE WHEN leases >= ? THEN 'failed' ELSE 'queued' END, owner = NULL "
+                    "WHERE run = ? AND state = 'leased' AND lease_expires <= ?",
+                    (self.max_leases, self.run, now),
+                )
+                rows = self._conn.execute(
+                    "SELECT url, page, leases FROM frontier WHERE run = ? AND kind = ? AND state = 'queued' ORDER BY created LIMIT ?",
+                    (self.run, kind, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE frontier SET state = 'leased', owner = ?, lease_expires = ?, leases = leases + 1 WHERE run = ? AND url = ?",
+                    [(owner, now + self.lease_seconds, self.run, url) for url, _, _ in rows],
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [WorkItem(url, kind, page, token=(url, leases + 1)) for url, page, leases in rows]
+
+    def _finish(self, item, state):
+        with self._lock:
+            # A stale lease failing never undoes a completion
+            self._conn.execute(
+                "UPDATE frontier SET state = ?, owner = NULL WHERE run = ? AND url = ? AND state != 'done'",
+                (state, self.run, item.url),
+            )
+
+    def complete(self, item):
+        self._finish(item, 'done')
+
+    def fail(self, item):
+        self._finish(item, 'failed')
+
+    def active(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM frontier WHERE run = ? AND state IN ('queued', 'leased')", (self.run,)
+            ).fetchone()[0]
+
+
+# Pops the first queued item that is not finished yet and records its lease in one atomic step
+_REDIS_LEASE_SCRIPT = """
+while true do
+  local raw = redis.call('LPOP', KEYS[1])
+  if not raw then return nil end
+  if redis.call('SISMEMBER', KEYS[3], cjson.decode(raw)['url']) == 0 then
+    redis.call('ZADD', KEYS[2], ARGV[1], raw)
+    return raw
+  end
+end
+"""
+
+
+class RedisFrontier(Frontier):
+    """
+    Frontier in Redis (or any server speaking the Redis protocol), shared by nodes on different machines.
+
+    Keys of a run: `<prefix>:seen` (set of URLs), `<prefix>:queue:<kind>` (list of items),
+    `<prefix>:leases` (sorted set of leased items by expiry), `<prefix>:leases_count` (hash)
+    and `<prefix>:finished` (set of completed or failed URLs).
+    """
+
+    def __init__(self, run: str, url: str = FRONTIER_REDIS_URL, lease_seconds: float = FRONTIER_LEASE_SECONDS,
+                 max_leases: int = FRONTIER_MAX_LEASES, retention: float = FRONTIER_RETENTION, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("FRONTIER_BACKEND is 'redis' but the redis package is not installed.")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.lease_seconds = lease_seconds
+        self.max_leases = max_leases
+        self.retention = int(retention)
+        self.prefix = f'frontier:{run}'
+        self._lease_script = client.register_script(_REDIS_LEASE_SCRIPT)
+
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+
+    def add(self, kind, url, page=1):
+        if not self.client.sadd(self._key('seen'), url):
+            return False
+        self.client.rpush(self._key(f'queue:{kind}'), json.dumps({'url': url, 'kind': kind, 'page': page}))
+        for name in ('seen', f'queue:{kind}'):
+            self.client.expire(self._key(name), self.retention)
+        return True
+
+    def _requeue_expired(self, now):
+        for raw in self.client.zrangebyscore(self._key('leases'), 0, now):
+            # Only the node whose ZREM succeeds requeues the item
+            if not self.client.zrem(self._key('leases'), raw):
+                continue
+            data = json.loads(raw)
+            if self.client.sismember(self._key('finished'), data['url']):
+                continue
+            if int(self.client.hget(self._key('leases_count'), data['url']) or 0) >= self.max_leases:
+                logger.error(f"Giving up on {data['url']} after {self.max_leases} expired leases.")
+                continue
+            self.client.rpush(self._key(f"queue:{data['kind']}"), raw)
+
+    def lease(self, kind, owner, limit=1):
+        now = time.time()
+        self._requeue_expired(now)
+        leased = []
+        for _ in range(limit):
+            raw = self._lease_script(
+                keys=[self._key(f'queue:{kind}'), self._key('leases'), self._key('finished')],
+                args=[now + self.lease_seconds],
+            )
+            if raw is None:
+                break
+            data = json.loads(raw)
+            count = self.client.hincrby(self._key('leases_count'), data['url'], 1)
+            leased.append(WorkItem(data['url'], kind, data['page'], token=(raw, count)))
+        for name in ('leases', 'leases_count'):
+            self.client.expire(self._key(name), self.retention)
+        return leased
+
+    def _finish(self, item):
+        self.client.sadd(self._key('finished'), item.url)
+        self.client.expire(self._key('finished'), self.retention)
+        self.client.zrem(self._key('leases'), item.token[0])
+
+    def complete(self, item):
+        self._finish(item)
+
+    def fail(self, item):
+        self._finish(item)
+
+    def active(self):
+        queued = sum(self.client.llen(key) for key in self.client.scan_iter(f'{self.prefix}:queue:*'))
+        return queued + self.client.zcard(self._key('leases'))
+
+
+def get_frontier(run: str) -> Frontier:
+    """Return the frontier of a crawl run for the backend selected by FRONTIER_BACKEND."""
+    if FRONTIER_BACKEND == 'memory':
+        return MemoryFrontier()
+    if FRONTIER_BACKEND == 'sqlite':
+        return SqliteFrontier(run)
+    if FRONTIER_BACKEND == 'redis':
+        return RedisFrontier(run)
+    raise ValueError(f"Unknown FRONTIER_BACKEND: {FRONTIER_BACKEND}")
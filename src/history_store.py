@@ -0,0 +1,404 @@
+import bisect
+import io
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from logs import logger
+from config import LOG_FILE_PATH, HISTORY_BACKEND, HISTORY_DB_PATH, HISTORY_SERIES_CACHE_SIZE
+from .records import RecordBatch
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Column order of the price history (matches the layout of the original price_log.csv)
+HISTORY_COLUMNS = ['asin', 'title', 'price', 'rating', 'image', 'url', 'timestamp']
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive OS lock on `path` (created if needed) for the duration of the block.
+
+    The lock is shared by every process on the machine (and by the nodes of a
+    shared file system that supports locks), unlike a threading.Lock.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def to_history_frame(records: Union[List[Dict], RecordBatch]) -> pd.DataFrame:
+    """Build a DataFrame with the history columns in a stable order."""
+    df = records.to_frame() if isinstance(records, RecordBatch) else pd.DataFrame(records)
+    for column in HISTORY_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    return df[HISTORY_COLUMNS]
+
+
+class HistoryStore:
+    """
+    Base class for price history backends.
+
+    A backend only has to support appending a batch of rows and reading the
+    rows back (optionally for a single ASIN). Appending must not depend on the
+    amount of history already stored.
+    """
+
+    def append(self, records: List[Dict]) -> int:
+        """Append rows to the history and return the number of rows written."""
+        raise NotImplementedError
+
+    def read(self, asin: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """Return the stored rows (all of them or for one ASIN), or None if there is no history yet."""
+        raise NotImplementedError
+
+    def latest_prices(self) -> Dict[str, float]:
+        """Return the most recent price of every ASIN in the history."""
+        df = self.read()
+        if df is None or df.empty:
+            return {}
+        df = df.assign(timestamp=pd.to_datetime(df['timestamp'])).sort_values(by='timestamp', kind='stable')
+        latest = df.drop_duplicates(subset='asin', keep='last')
+        return dict(zip(latest['asin'], latest['price']))
+
+    def min_prices_since(self, since: str, asins: Optional[List[str]] = None) -> Dict[str, float]:
+        """Return the lowest price of every ASIN (or of `asins`) recorded at or after `since` ('%Y-%m-%d %H:%M:%S')."""
+        df = self.read()
+        if df is None or df.empty:
+            return {}
+        df = df[df['timestamp'].astype(str) >= since]
+        if asins is not None:
+            df = df[df['asin'].isin(asins)]
+        return df.groupby('asin')['price'].min().to_dict()
+
+    def history(self, asin: str) -> Tuple[List[str], List[float]]:
+        """Return the timestamps and prices of one ASIN in time order."""
+        df = self.read(asin)
+        if df is None or df.empty:
+            return [], []
+        df = df.sort_values(by='timestamp', kind='stable')
+        return df['timestamp'].tolist(), df['price'].tolist()
+
+    def rewrite(self, transform: Callable[[pd.DataFrame], pd.DataFrame]) -> Tuple[int, int]:
+        """
+        Replace the whole history with `transform(rows)` in one atomic step.
+
+        Appends from every process sharing the history wait until the rewrite
+        is done. Returns the number of rows before and after the rewrite.
+        """
+        raise NotImplementedError
+
+    def signature(self):
+        """Return a cheap value that changes whenever the stored history is modified."""
+        raise NotImplementedError
+
+
+class CsvHistoryStore(HistoryStore):
+    """
+    Append-only CSV history. New rows are appended to the end of the file without rewriting it.
+
+    Appends and rewrites hold an OS lock on `<path>.lock`, so a compaction in
+    one process never drops the rows another process appends meanwhile.
+
+    The time series of the `max_series` most recently requested ASINs are kept
+    in memory and extended with the rows appended since the last request.
+    """
+
+    def __init__(self, path: str = LOG_FILE_PATH, max_series: int = HISTORY_SERIES_CACHE_SIZE):
+        self.path = os.path.abspath(path)
+        self.max_series = max_series
+        self._lock_path = self.path + '.lock'
+        self._lock = threading.Lock()
+        # Time series of the cached ASINs (least recently used first) built from the first `_series_offset` bytes of the file
+        self._series = OrderedDict()
+        self._series_offset = 0
+        self._series_mtime = None
+        # Device and inode of the file the series were read from, a rewrite swaps in a new file
+        self._series_file = None
+
+    def append(self, records: List[Dict]) -> int:
+        if not records:
+            return 0
+        df = to_history_frame(records)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with file_lock(self._lock_path):
+                write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                df.to_csv(self.path, mode='a', header=write_header, index=False)
+        return len(df)
+
+    def read(self, asin: Optional[str] = None) -> Optional[pd.DataFrame]:
+        try:
+            df = pd.read_csv(self.path)
+        except FileNotFoundError:
+            return None
+        if asin is not None:
+            df = df[df['asin'] == asin]
+        return df
+
+    def rewrite(self, transform: Callable[[pd.DataFrame], pd.DataFrame]) -> Tuple[int, int]:
+        if not os.path.exists(self.path):
+            return 0, 0
+        with self._lock, file_lock(self._lock_path):
+            try:
+                df = pd.read_csv(self.path)
+            except FileNotFoundError:
+                return 0, 0
+            rewritten = to_history_frame(transform(df))
+            # Written next to the log and swapped in, so readers see either the old or the new file
+            temp_path = self.path + '.tmp'
+            rewritten.to_csv(temp_path, index=False)
+            os.replace(temp_path, self.path)
+            self._reset_series()
+        return len(df), len(rewritten)
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _reset_series(self):
+        self._series, self._series_offset, self._series_mtime, self._series_file = OrderedDict(), 0, None, None
+
+    def _update_series(self):
+        """Extend the cached series with the rows appended since the last call, or start over if the file was rewritten."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self._reset_series()
+            return
+        with f:
+            # Stat the open file, so the size and inode belong to the bytes read below
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id == self._series_file and stat.st_size == self._series_offset and stat.st_mtime_ns == self._series_mtime:
+                return
+            if file_id != self._series_file or stat.st_size <= self._series_offset:
+                # The file was rewritten (by this or another process) rather than appended to, start over.
+                # A compaction swaps in a new file, which can grow past the old offset before it is seen.
+                self._reset_series()
+                self._series_file = file_id
+            f.seek(self._series_offset)
+            tail = f.read()
+        # Only index complete lines, a concurrent writer may be halfway through one
+        tail = tail[:tail.rfind(b'\n') + 1]
+        if tail and self._series:
+            if self._series_offset:
+                df = pd.read_csv(io.BytesIO(tail), header=None, names=HISTORY_COLUMNS, usecols=['asin', 'timestamp', 'price'])
+            else:
+                df = pd.read_csv(io.BytesIO(tail), usecols=['asin', 'timestamp', 'price'])
+            df = df.sort_values(by='timestamp', kind='stable')
+            df = df[df['asin'].isin(self._series.keys())]
+            for asin, group in df.groupby('asin', sort=False):
+                timestamps, prices = self._series[asin]
+                timestamps.extend(group['timestamp'].tolist())
+                prices.extend(group['price'].tolist())
+                if len(timestamps) > len(group) and timestamps[-len(group) - 1] > timestamps[-len(group)]:
+                    # Out-of-order rows, restore the time order of this series
+                    pairs = sorted(zip(timestamps, prices), key=lambda pair: pair[0])
+                    timestamps[:], prices[:] = [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+        self._series_offset += len(tail)
+        self._series_mtime = stat.st_mtime_ns
+
+    def _cached_series(self, asins: List[str]) -> Dict[str, Tuple[List[str], List[float]]]:
+        """Return the series of `asins`, reading the ones that are not cached from the indexed part of the file."""
+        self._update_series()
+        missing = [asin for asin in dict.fromkeys(asins) if asin not in self._series]
+        if missing:
+            loaded = {}
+            if self._series_offset:
+                with open(self.path, 'rb') as f:
+                    head = f.read(self._series_offset)
+                df = pd.read_csv(io.BytesIO(head), usecols=['asin', 'timestamp', 'price'])
+                df = df[df['asin'].isin(missing)].sort_values(by='timestamp', kind='stable')
+                loaded = {asin: (group['timestamp'].tolist(), group['price'].tolist()) for asin, group in df.groupby('asin', sort=False)}
+            for asin in missing:
+                self._series[asin] = loaded.get(asin, ([], []))
+        series = {}
+        for asin in asins:
+            self._series.move_to_end(asin)
+            series[asin] = self._series[asin]
+        while len(self._series) > self.max_series:
+            self._series.popitem(last=False)
+        return series
+
+    def history(self, asin: str) -> Tuple[List[str], List[float]]:
+        with self._lock:
+            timestamps, prices = self._cached_series([asin])[asin]
+            return list(timestamps), list(prices)
+
+    def min_prices_since(self, since: str, asins: Optional[List[str]] = None) -> Dict[str, float]:
+        if asins is None:
+            # Every ASIN does not fit the series cache, scan the file once instead
+            return super().min_prices_since(since)
+        # Served from the per-ASIN series, whose timestamps are sorted
+        with self._lock:
+            lowest = {}
+            for asin, (timestamps, prices) in self._cached_series(asins).items():
+                start = bisect.bisect_left(timestamps, since)
+                if start < len(prices):
+                    lowest[asin] = min(prices[start:])
+            return lowest
+
+
+class SqliteHistoryStore(HistoryStore):
+    """SQLite history with an (asin, timestamp) index, so appends and per-ASIN reads stay cheap."""
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS price_history ('
+                'asin TEXT NOT NULL, title TEXT, price REAL, rating TEXT, '
+                'image TEXT, url TEXT, timestamp TEXT NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_price_history_asin_ts '
+                'ON price_history (asin, timestamp)'
+            )
+
+    def append(self, records: List[Dict]) -> int:
+        if not records:
+            return 0
+        df = to_history_frame(records)
+        with self._lock, self._conn:
+            self._insert(df)
+        return len(df)
+
+    def _insert(self, df: pd.DataFrame):
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        placeholders = ', '.join('?' for _ in HISTORY_COLUMNS)
+        self._conn.executemany(
+            f'INSERT INTO price_history ({", ".join(HISTORY_COLUMNS)}) VALUES ({placeholders})',
+            rows,
+        )
+
+    def read(self, asin: Optional[str] = None) -> Optional[pd.DataFrame]:
+        query = f'SELECT {", ".join(HISTORY_COLUMNS)} FROM price_history'
+        params = ()
+        if asin is not None:
+            query += ' WHERE asin = ? ORDER BY timestamp'
+            params = (asin,)
+        with self._lock:
+            df = pd.read_sql_query(query, self._conn, params=params)
+        if df.empty and asin is None:
+            return None
+        return df
+
+    def latest_prices(self) -> Dict[str, float]:
+        # SQLite returns the bare price column from the row holding MAX(timestamp)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT asin, price, MAX(timestamp) FROM price_history GROUP BY asin'
+            ).fetchall()
+        return {asin: price for asin, price, _ in rows}
+
+    def min_prices_since(self, since: str, asins: Optional[List[str]] = None) -> Dict[str, float]:
+        query = 'SELECT asin, MIN(price) FROM price_history WHERE timestamp >= ?'
+        params = [since]
+        if asins is not None:
+            if not asins:
+                return {}
+            query += f' AND asin IN ({", ".join("?" for _ in asins)})'
+            params.extend(asins)
+        with self._lock:
+            rows = self._conn.execute(query + ' GROUP BY asin', params).fetchall()
+        return {asin: price for asin, price in rows if price is not None}
+
+    def rewrite(self, transform: Callable[[pd.DataFrame], pd.DataFrame]) -> Tuple[int, int]:
+        with self._lock:
+            # BEGIN IMMEDIATE keeps other processes from appending between the read and the write
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                df = pd.read_sql_query(f'SELECT {", ".join(HISTORY_COLUMNS)} FROM price_history', self._conn)
+                if df.empty:
+                    self._conn.rollback()
+                    return 0, 0
+                rewritten = to_history_frame(transform(df))
+                self._conn.execute('DELETE FROM price_history')
+                self._insert(rewritten)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            # Give the freed pages back to the file system (the checkpoint moves the vacuumed pages out of the WAL)
+            self._conn.execute('VACUUM')
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return len(df), len(rewritten)
+
+    def signature(self):
+        # data_version changes when another connection commits to the database
+        with self._lock:
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            return (data_version, self._conn.total_changes)
+
+
+def migrate_csv_to_sqlite(csv_path: str = LOG_FILE_PATH, db_path: str = HISTORY_DB_PATH, chunksize: int = 50000) -> int:
+    """
+    Copy an existing CSV price log into a SQLite history store.
+
+    Parameters:
+    - csv_path: Path of the CSV log to import
+    - db_path: Path of the SQLite database to write to
+    - chunksize: Number of CSV rows to read and insert at once
+
+    Returns:
+    - Number of rows imported
+    """
+    store = SqliteHistoryStore(db_path)
+    imported = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        imported += store.append(chunk.to_dict('records'))
+    logger.info(f"Migrated {imported} rows from {csv_path} to {db_path}")
+    return imported
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Return the process-wide history store selected by HISTORY_BACKEND."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if HISTORY_BACKEND == 'sqlite':
+                _store = SqliteHistoryStore(HISTORY_DB_PATH)
+            elif HISTORY_BACKEND == 'csv':
+                _store = CsvHistoryStore(LOG_FILE_PATH)
+            else:
+                raise ValueError(f"Unknown HISTORY_BACKEND: {HISTORY_BACKEND}")
+        return _store
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ['migrate']:
+        print(f"Imported {migrate_csv_to_sqlite()} rows.")
+    else:
+        print("Usage: python -m src.history_store migrate")
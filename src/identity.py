@@ -0,0 +1,210 @@
+import atexit
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+from logs import logger
+from config import (
+    USER_AGENTS,
+    PROXIES,
+    IDENTITY_MIN_INTERVAL,
+    IDENTITY_BAN_COOLDOWN,
+    IDENTITY_ERROR_COOLDOWN,
+    IDENTITY_MAX_COOLDOWN,
+    IDENTITY_STATE_PATH,
+)
+
+# Weight of the newest observation in the success rate and latency averages
+EWMA_ALPHA = 0.2
+
+# Success rate below which ordinary errors (timeouts, connection errors) also put an identity on cooldown
+UNHEALTHY_SUCCESS_RATE = 0.5
+
+# Minimum number of seconds between two writes of the persisted state
+SAVE_INTERVAL = 10
+
+
+class Identity:
+    """A User-Agent (optionally bound to a proxy) and its health statistics."""
+
+    __slots__ = ('user_agent', 'proxy', 'available_at', 'success_rate', 'latency', 'failures', 'version')
+
+    def __init__(self, user_agent: str, proxy: Optional[str] = None):
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.available_at = 0.0
+        self.success_rate = 1.0
+        self.latency = None
+        self.failures = 0
+        self.version = 0
+
+    @property
+    def key(self) -> str:
+        return f'{self.user_agent}|{self.proxy or ""}'
+
+
+class IdentityScheduler:
+    """
+    Chooses the identity for each request.
+
+    Identities sit in a heap ordered by the time their cooldown expires, so
+    picking one is O(log n) regardless of the pool size. Every use pushes the
+    identity back by IDENTITY_MIN_INTERVAL, which rotates through the pool.
+    Bans and repeated errors push it back by an exponential, jittered
+    cooldown, so unhealthy identities stop being picked. All methods are
+    thread-safe, and the state can be persisted to IDENTITY_STATE_PATH.
+    """
+
+    def __init__(self, identities: List[Identity], state_path: Optional[str] = IDENTITY_STATE_PATH,
+                 min_interval: float = IDENTITY_MIN_INTERVAL, ban_cooldown: float = IDENTITY_BAN_COOLDOWN,
+                 error_cooldown: float = IDENTITY_ERROR_COOLDOWN, max_cooldown: float = IDENTITY_MAX_COOLDOWN):
+        self.min_interval = min_interval
+        self.ban_cooldown = ban_cooldown
+        self.error_cooldown = error_cooldown
+        self.max_cooldown = max_cooldown
+        self.state_path = os.path.abspath(state_path) if state_path else None
+        self._identities = {identity.key: identity for identity in identities}
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        if self.state_path:
+            self._load()
+            atexit.register(self.save)
+        for identity in self._identities.values():
+            self._push(identity)
+
+    def _push(self, identity: Identity):
+        # Older heap entries of the identity become stale and are skipped when popped
+        identity.version = next(self._counter)
+        heapq.heappush(self._heap, (identity.available_at, identity.version, identity.key))
+
+    def acquire(self, exclude: Optional[Identity] = None) -> Optional[Identity]:
+        """Return the identity whose cooldown expired first, or None if every identity is cooling down."""
+        now = time.time()
+        skipped = []
+        chosen = None
+        with self._lock:
+            while self._heap:
+                available_at, version, key = heapq.heappop(self._heap)
+                identity = self._identities[key]
+                if version != identity.version:
+                    continue  # Stale entry
+                if available_at > now:
+                    skipped.append(identity)
+                    break
+                if identity is exclude and len(self._identities) > 1:
+                    skipped.append(identity)
+                    continue
+                chosen = identity
+                break
+            for identity in skipped:
+                heapq.heappush(self._heap, (identity.available_at, identity.version, identity.key))
+            if chosen is not None:
+                chosen.available_at = now + self.min_interval
+                self._push(chosen)
+        return chosen
+
+    def report_success(self, identity: Identity, latency: float):
+        """Record a successful request and its latency."""
+        with self._lock:
+            identity.success_rate = (1 - EWMA_ALPHA) * identity.success_rate + EWMA_ALPHA
+            identity.latency = latency if identity.latency is None else (1 - EWMA_ALPHA) * identity.latency + EWMA_ALPHA * latency
+            identity.failures = 0
+        self._maybe_save()
+
+    def report_failure(self, identity: Identity, banned: bool = False, retry_after: Optional[float] = None):
+        """
+        Record a failed request.
+
+        Bans (503 responses) always put the identity on cooldown. Other errors
+        only do so once its success rate drops below UNHEALTHY_SUCCESS_RATE.
+        The cooldown doubles with every consecutive failure and is jittered
+        so identities banned together do not come back together.
+        """
+        with self._lock:
+            identity.success_rate = (1 - EWMA_ALPHA) * identity.success_rate
+            identity.failures += 1
+            if banned or identity.success_rate < UNHEALTHY_SUCCESS_RATE:
+                base = self.ban_cooldown if banned else self.error_cooldown
+                cooldown = min(self.max_cooldown, base * 2 ** (identity.failures - 1))
+                cooldown *= random.uniform(0.75, 1.25)
+                if retry_after:
+                    cooldown = max(cooldown, retry_after)
+                identity.available_at = max(identity.available_at, time.time() + cooldown)
+                self._push(identity)
+                logger.warning(f"User-Agent {identity.user_agent} cooling down for {cooldown:.0f} sec after {identity.failures} failure(s).")
+        self._maybe_save()
+
+    def stats(self) -> List[Dict]:
+        """Return the health statistics of every identity."""
+        with self._lock:
+            return [
+                {
+                    'user_agent': identity.user_agent,
+                    'proxy': identity.proxy,
+                    'available_in': max(0.0, identity.available_at - time.time()),
+                    'success_rate': identity.success_rate,
+                    'latency': identity.latency,
+                    'failures': identity.failures,
+                }
+                for identity in self._identities.values()
+            ]
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        for key, saved in state.items():
+            identity = self._identities.get(key)
+            if identity is None:
+                continue  # No longer configured
+            identity.available_at = saved.get('available_at', 0.0)
+            identity.success_rate = saved.get('success_rate', 1.0)
+            identity.latency = saved.get('latency')
+            identity.failures = saved.get('failures', 0)
+
+    def _maybe_save(self):
+        if self.state_path and time.time() - self._last_save >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """Write the identity state to IDENTITY_STATE_PATH."""
+        if not self.state_path:
+            return
+        with self._lock:
+            self._last_save = time.time()
+            state = {
+                key: {
+                    'available_at': identity.available_at,
+                    'success_rate': identity.success_rate,
+                    'latency': identity.latency,
+                    'failures': identity.failures,
+                }
+                for key, identity in self._identities.items()
+            }
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_identity_scheduler() -> IdentityScheduler:
+    """Return the process-wide scheduler over USER_AGENTS (crossed with PROXIES when configured)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            proxies = PROXIES or [None]
+            _scheduler = IdentityScheduler([Identity(agent, proxy) for agent in USER_AGENTS for proxy in proxies])
+        return _scheduler
@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from logs import logger
+from config import JOB_REPORT_INTERVAL
+from .metrics import get_metrics
+
+# Number of recent runs kept per job for the latency and lag report
+REPORT_WINDOW = 100
+
+
+def _percentile(values, percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+class Job:
+    """
+    A function run every `interval` seconds in its own executor.
+
+    Parameters:
+    - name: Name used in logs, thread names and the report
+    - func: Function to run (without arguments)
+    - interval: Seconds between two scheduled runs
+    - priority: Jobs with a higher priority are started first when several are due
+    - deadline: Seconds after its scheduled time within which a run has to start (it is dropped
+      otherwise) and should finish (it is counted as late otherwise). None disables both checks.
+    - overlap: What happens when a run is due while the previous one is still running:
+      'skip' drops it, 'coalesce' runs the job once more right after the current run
+      (however many runs were due meanwhile)
+    """
+
+    def __init__(self, name: str, func: Callable[[], None], interval: float, priority: int = 0,
+                 deadline: Optional[float] = None, overlap: str = 'skip'):
+        if overlap not in ('skip', 'coalesce'):
+            raise ValueError(f"Unknown overlap policy: {overlap}")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.priority = priority
+        self.deadline = deadline
+        self.overlap = overlap
+        self.next_run = time.time() + interval
+        self.running = False
+        # Scheduled time of the run waiting for the current one to finish (coalesce only)
+        self.coalesced_at = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'job-{name}')
+        self.counts = {'runs': 0, 'failed': 0, 'skipped': 0, 'coalesced': 0, 'missed': 0, 'late': 0}
+        self.lags = deque(maxlen=REPORT_WINDOW)
+        self.latencies = deque(maxlen=REPORT_WINDOW)
+        self.last_error = None
+
+    def report(self) -> Dict:
+        """Return the run counts and the lag / latency percentiles of the recent runs."""
+        return dict(
+            self.counts,
+            name=self.name,
+            running=self.running,
+            lag_p50=_percentile(self.lags, 50),
+            lag_max=max(self.lags, default=None),
+            latency_p50=_percentile(self.latencies, 50),
+            latency_p95=_percentile(self.latencies, 95),
+            latency_max=max(self.latencies, default=None),
+            last_error=self.last_error,
+        )
+
+
+class JobRunner:
+    """
+    Runs periodic jobs concurrently.
+
+    Every job has its own single-thread executor, so a long run of one job
+    (like a daily search crawl) never delays the others. A scheduler thread
+    wakes up when the next job is due, applies the job's overlap policy and
+    deadline, and submits it. Start lag (time between the scheduled and the
+    actual start) and run latency are recorded per job and logged every
+    JOB_REPORT_INTERVAL seconds.
+    """
+
+    def __init__(self, report_interval: float = JOB_REPORT_INTERVAL):
+        self.report_interval = report_interval
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def add(self, name: str, func: Callable[[], None], interval: float, priority: int = 0,
+            deadline: Optional[float] = None, overlap: str = 'skip') -> Job:
+        """Register a job. Its first run is due one interval from now."""
+        job = Job(name, func, interval, priority, deadline, overlap)
+        with self._condition:
+            self._jobs[name] = job
+            self._push(job)
+            self._condition.notify()
+        return job
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.next_run, -job.priority, next(self._counter), job.name))
+
+    def _dispatch(self, job: Job, scheduled: float, now: float):
+        # Called with the condition held
+        if job.deadline is not None and now > scheduled + job.deadline:
+            job.counts['missed'] += 1
+            logger.warning(f"Job {job.name} missed its deadline: run scheduled {now - scheduled:.1f} sec ago was dropped.")
+            return
+        if job.running:
+            if job.overlap == 'coalesce':
+                if job.coalesced_at is None:
+                    job.coalesced_at = scheduled
+                job.counts['coalesced'] += 1
+            else:
+                job.counts['skipped'] += 1
+                logger.info(f"Job {job.name} is still running, skipping the run scheduled at {time.strftime('%H:%M:%S', time.localtime(scheduled))}.")
+            return
+        job.running = True
+        job.executor.submit(self._run, job, scheduled)
+
+    def _run(self, job: Job, scheduled: float):
+        while True:
+            started = time.time()
+            job.lags.append(started - scheduled)
+            try:
+                job.func()
+            except Exception as e:
+                job.counts['failed'] += 1
+                job.last_error = str(e)
+                logger.error(f"Job {job.name} failed: {e}")
+            finished = time.time()
+            job.latencies.append(finished - started)
+            job.counts['runs'] += 1
+            get_metrics().observe('job_seconds', finished - started, job=job.name)
+            get_metrics().observe('job_lag_seconds', started - scheduled, job=job.name)
+            if job.deadline is not None and finished > scheduled + job.deadline:
+                job.counts['late'] += 1
+                logger.warning(f"Job {job.name} finished {finished - scheduled - job.deadline:.1f} sec after its deadline.")
+
+            with self._condition:
+                scheduled, job.coalesced_at = job.coalesced_at, None
+                if scheduled is None or self._stopped:
+                    job.running = False
+                    return
+
+    def run_pending(self) -> float:
+        """Dispatch the due jobs and return the number of seconds until the next one is due."""
+        now = time.time()
+        with self._condition:
+            # Due jobs pop in order of scheduled time, then priority
+            while self._heap and self._heap[0][0] <= now:
+                scheduled, _, _, name = heapq.heappop(self._heap)
+                job = self._jobs[name]
+                self._dispatch(job, scheduled, now)
+                # Keep the cadence: the next run is due one interval after the scheduled one, not after the actual start
+                job.next_run = scheduled + job.interval
+                if job.next_run <= now:
+                    job.next_run = now + job.interval - (now - scheduled) % job.interval
+                self._push(job)
+            return self._heap[0][0] - now if self._heap else self.report_interval
+
+    def run_forever(self):
+        """Run the jobs until stop() is called."""
+        next_report = time.time() + self.report_interval
+        while True:
+            wait = self.run_pending()
+            if time.time() >= next_report:
+                self.log_report()
+                next_report = time.time() + self.report_interval
+            with self._condition:
+                if self._stopped:
+                    return
+                self._condition.wait(max(0.0, min(wait, next_report - time.time())))
+
+    def stop(self, wait: bool = True):
+        """Stop dispatching runs and optionally wait for the running ones."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for job in self._jobs.values():
+            job.executor.shutdown(wait=wait)
+
+    def report(self) -> List[Dict]:
+        """Return the report of every job."""
+        with self._condition:
+            return [job.report() for job in self._jobs.values()]
+
+    def log_report(self):
+        """Log the run counts, lag and latency of every job."""
+        for entry in self.report():
+            def seconds(value):
+                return 'n/a' if value is None else f'{value:.1f}s'
+            logger.info(
+                f"Job {entry['name']}: {entry['runs']} runs ({entry['failed']} failed, {entry['skipped']} skipped, "
+                f"{entry['coalesced']} coalesced, {entry['missed']} missed, {entry['late']} late), "
+                f"lag p50 {seconds(entry['lag_p50'])} max {seconds(entry['lag_max'])}, "
+                f"latency p50 {seconds(entry['latency_p50'])} p95 {seconds(entry['latency_p95'])} max {seconds(entry['latency_max'])}"
+            )
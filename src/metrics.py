@@ -0,0 +1,237 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from logs import logger
+from config import (
+    METRICS_EXPORTER,
+    METRICS_PORT,
+    METRICS_JSONL_PATH,
+    METRICS_INTERVAL,
+    PROFILER_INTERVAL,
+    PROFILER_OUTPUT,
+)
+
+# Upper bounds (in seconds) of the timer histogram buckets
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels: Dict) -> Tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    pairs = key + (extra or ())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Timer:
+    """Histogram of durations with Prometheus-style cumulative buckets."""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(TIMER_BUCKETS)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(TIMER_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+
+class Metrics:
+    """
+    Counters and timers of the scraping stages.
+
+    Metrics are keyed by name and labels, e.g. `inc('fetch_bytes_total', 1024)` or
+    `observe('parse_seconds', 0.02, kind='product')`. Updates only take a lock
+    and touch a few integers, so they are cheap enough for the hot path.
+    """
+
+    def __init__(self):
+        self._counters = Counter()
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = Timer()
+            timer.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time the block and record it under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict:
+        """Return every counter and timer as plain data."""
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(key), 'value': value}
+                    for (name, key), value in sorted(self._counters.items())
+                ],
+                'timers': [
+                    {'name': name, 'labels': dict(key), 'count': timer.count, 'sum': timer.total, 'max': timer.max}
+                    for (name, key), timer in sorted(self._timers.items())
+                ],
+            }
+
+    def prometheus_text(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f'# TYPE amazon_scraper_{name} counter')
+                for (counter_name, key), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f'amazon_scraper_{name}{_format_labels(key)} {value}')
+            for name in sorted({name for name, _ in self._timers}):
+                lines.append(f'# TYPE amazon_scraper_{name} histogram')
+                for (timer_name, key), timer in sorted(self._timers.items()):
+                    if timer_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(TIMER_BUCKETS, timer.buckets):
+                        cumulative += count
+                        lines.append(f'amazon_scraper_{name}_bucket{_format_labels(key, (("le", bound),))} {cumulative}')
+                    lines.append(f'amazon_scraper_{name}_bucket{_format_labels(key, (("le", "+Inf"),))} {timer.count}')
+                    lines.append(f'amazon_scraper_{name}_sum{_format_labels(key)} {timer.total}')
+                    lines.append(f'amazon_scraper_{name}_count{_format_labels(key)} {timer.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_jsonl(self, path: str = METRICS_JSONL_PATH):
+        """Append a timestamped snapshot to a JSONL file."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(self.snapshot(), timestamp=time.strftime('%Y-%m-%d %H:%M:%S'))) + '\n')
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stacks of every thread.
+
+    Every `interval` seconds a background thread records the current stack of
+    each other thread. The counts are written as folded stacks (one
+    `frame;frame;frame count` line per stack), which flamegraph tools read
+    directly. Sampling costs nothing in the profiled threads.
+    """
+
+    def __init__(self, interval: float, output: str = PROFILER_OUTPUT):
+        self.interval = interval
+        self.output = output
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, 'thread'))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """Stop sampling and write the folded stacks to `output`."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+        with open(self.output, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        logger.info(f"Wrote {sum(self.samples.values())} profiler samples to {self.output}")
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics."""
+    return _metrics
+
+
+def start_exporter(exporter: Optional[str] = METRICS_EXPORTER) -> None:
+    """
+    Start exporting the metrics in the background.
+
+    Parameters:
+    - exporter: 'prometheus' serves /metrics on METRICS_PORT, 'jsonl' appends a snapshot
+      to METRICS_JSONL_PATH every METRICS_INTERVAL seconds (and at exit), None does nothing
+    """
+    if exporter == 'prometheus':
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = _metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', METRICS_PORT), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+        logger.info(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    elif exporter == 'jsonl':
+        def export():
+            while True:
+                time.sleep(METRICS_INTERVAL)
+                _metrics.write_jsonl()
+
+        threading.Thread(target=export, name='metrics-exporter', daemon=True).start()
+        atexit.register(_metrics.write_jsonl)
+    elif exporter is not None:
+        logger.warning(f"Unknown METRICS_EXPORTER '{exporter}' ignored.")
+
+
+def start_profiler(interval: float = PROFILER_INTERVAL) -> Optional[SamplingProfiler]:
+    """Start the sampling profiler when PROFILER_INTERVAL is set. The samples are written at exit."""
+    if not interval:
+        return None
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    return profiler
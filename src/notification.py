@@ -1,18 +1,20 @@
 import tkinter as tk
 from tkinter import ttk
-import pandas as pd
-import plotly.graph_objects as go
 import webbrowser
 import tempfile
 import os
-from datetime import datetime
-from config import LOG_FILE_PATH 
+import sys
+import json
+from .price_series import get_price_series
 
 
-def generate_price_chart(prices, timestamps, product_title, url):
+def generate_price_chart(prices, timestamps, product_title, url, asin=None):
     """
     Generate an interactive price chart using Plotly and save it as an HTML file.
     """
+    # Plotly is only loaded when a chart is actually requested
+    import plotly.graph_objects as go
+
     # Create the chart
     product_url = url
     fig = go.Figure()
@@ -24,15 +26,16 @@ def generate_price_chart(prices, timestamps, product_title, url):
         template="plotly_white"
     )
 
-    # Save the chart to a temporary HTML file
-    temp_dir = tempfile.gettempdir()
-    chart_path = os.path.join(temp_dir, 'price_chart.html')
-    fig.write_html(chart_path)
+    # Save the chart next to a shared copy of plotly.js, which is only written once
+    chart_dir = os.path.join(tempfile.gettempdir(), 'amazon_scraper_charts')
+    os.makedirs(chart_dir, exist_ok=True)
+    chart_path = os.path.join(chart_dir, f'price_chart_{asin}.html' if asin else 'price_chart.html')
+    fig.write_html(chart_path, include_plotlyjs='directory')
 
     return chart_path
 
 class CustomNotification:
-    def __init__(self, title, product_title, previous_price, price, asin, url, timeout=None):
+    def __init__(self, title, product_title, previous_price, price, asin, url, timeout=None, message=None):
         self.window = tk.Tk()
         self.window.title("")
         self.window.overrideredirect(True)  # Remove window decorations
@@ -70,7 +73,9 @@ class CustomNotification:
         ttk.Label(self.frame, text=title, style="Title.TLabel").pack(anchor="w")
         
         # Message
-        ttk.Label(self.frame, text=f'Price dropped for "{product_title[:50]}...": {previous_price} -> {price}', style="Message.TLabel", wraplength=280).pack(pady=10)
+        if message is None:
+            message = f'Price dropped for "{product_title[:50]}...": {previous_price} -> {price}'
+        ttk.Label(self.frame, text=message, style="Message.TLabel", wraplength=280).pack(pady=10)
         
         # Buttons frame
         button_frame = ttk.Frame(self.frame)
@@ -90,21 +95,10 @@ class CustomNotification:
         # Add your chart viewing logic here
         print("Opening chart...")
         
-        df = pd.read_csv(LOG_FILE_PATH)
-        # Ensure timestamp is in datetime format
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        # Sort by timestamp (most recent first)
-        df_sorted = df.sort_values(by='timestamp', ascending=True)
-        
-        # Filter rows with the corresponding ASIN
-        filtered_rows = df_sorted[df_sorted['asin'] == self.asin]
-        
-        # Access price and timestamp for all rows
-        prices = filtered_rows['price'].tolist()
-        timestamps = filtered_rows['timestamp'].tolist()
-        prices.append(self.price)
-        timestamps.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        chart_path = generate_price_chart(prices, timestamps, self.product_title, self.url)
+        # Price history of this product only, in time order and downsampled for long histories
+        # The drop being shown was written to the history before this notification
+        timestamps, prices = get_price_series(self.asin)
+        chart_path = generate_price_chart(prices, timestamps, self.product_title, self.url, self.asin)
 
         # Open the chart in the default web browser
         webbrowser.open(f"file://{chart_path}")
@@ -118,6 +112,9 @@ class CustomNotification:
     def show(self):
         self.window.mainloop()
 
+# Tk only works on the main thread on macOS, so these run on the main thread of a helper
+# process started by the desktop notification sink (see the bottom of this file)
+
 def display_notification(product_title, previous_price, price, asin, url, timeout=None):
     notification = CustomNotification(
         title="Price Drop Alert",
@@ -128,4 +125,31 @@ def display_notification(product_title, previous_price, price, asin, url, timeou
         asin=asin,
         url=url,
     )
-    notification.show()
\ No newline at end of file
+    notification.show()
+
+def display_digest_notification(drops, timeout=None):
+    """Show one notification for several price drops. View Chart opens the chart of the largest drop."""
+    largest = max(drops, key=lambda drop: drop['previous_price'] - drop['price'])
+    lines = [f'"{drop["title"][:30]}...": {drop["previous_price"]} -> {drop["price"]}' for drop in drops[:3]]
+    if len(drops) > 3:
+        lines.append(f'and {len(drops) - 3} more')
+    notification = CustomNotification(
+        title=f"{len(drops)} Price Drop Alerts",
+        previous_price=largest['previous_price'],
+        product_title=largest['title'],
+        price=largest['price'],
+        timeout=timeout,
+        asin=largest['asin'],
+        url=largest['url'],
+        message='\n'.join(lines),
+    )
+    notification.show()
+
+if __name__ == "__main__":
+    # Started by DesktopSink with the drops as JSON on stdin, exits once the popup is closed
+    drops = json.load(sys.stdin)
+    if len(drops) == 1:
+        drop = drops[0]
+        display_notification(drop['title'], drop['previous_price'], drop['price'], drop['asin'], drop['url'])
+    else:
+        display_digest_notification(drops)
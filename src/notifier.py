@@ -0,0 +1,202 @@
+import atexit
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+import requests
+from logs import logger
+from config import NOTIFICATION_SINKS, NOTIFICATION_WEBHOOK_URL, NOTIFICATION_JSONL_PATH, HEADLESS
+from .metrics import get_metrics
+
+
+class NotificationSink:
+    """Delivers a list of price drops. A list with more than one drop is a digest."""
+
+    def send(self, drops: List[Dict]) -> None:
+        raise NotImplementedError
+
+
+# Directory the helper process of the desktop popups runs in (where `src`, `config` and `logs` are importable)
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class DesktopSink(NotificationSink):
+    """Tkinter popup (one per drop, or one digest popup for a batch), shown by a helper process."""
+
+    def send(self, drops):
+        # Tk must run on the main thread (macOS refuses anything else), so the popup is shown by
+        # `python -m src.notification` instead of this notifier thread. This process never loads Tkinter.
+        subprocess.run(
+            [sys.executable, '-m', 'src.notification'],
+            input=json.dumps(drops), text=True, cwd=_PROJECT_DIR, check=True,
+        )
+
+
+class WebhookSink(NotificationSink):
+    """POSTs the drops as JSON to a local endpoint."""
+
+    def __init__(self, url: str = NOTIFICATION_WEBHOOK_URL, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, drops):
+        response = requests.post(self.url, json={'drops': drops}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class JsonlSink(NotificationSink):
+    """Appends one JSON line per drop to a file."""
+
+    def __init__(self, path: str = NOTIFICATION_JSONL_PATH):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def send(self, drops):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for drop in drops:
+                f.write(json.dumps(drop) + '\n')
+
+
+class StdoutSink(NotificationSink):
+    """Prints the drops."""
+
+    def send(self, drops):
+        if len(drops) > 1:
+            print(f"{len(drops)} price drops:")
+        for drop in drops:
+            print(f'Price dropped for "{drop["title"][:50]}" ({drop["asin"]}): {drop["previous_price"]} -> {drop["price"]}')
+
+
+SINKS = {
+    'desktop': DesktopSink,
+    'webhook': WebhookSink,
+    'jsonl': JsonlSink,
+    'stdout': StdoutSink,
+}
+
+
+def make_drop(title: str, previous_price: float, price: float, asin: str, url: str, reason: str = 'threshold') -> Dict:
+    """Build the notification of a price drop. `reason` names the rule that fired ('threshold' or 'lowest_<N>d')."""
+    return {
+        'title': title,
+        'previous_price': previous_price,
+        'price': price,
+        'asin': asin,
+        'url': url,
+        'reason': reason,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+class Digest:
+    """Collects the drops of one crawl (see NotificationDispatcher.digest). Any thread may notify it."""
+
+    def __init__(self):
+        self.drops = []
+        self._lock = threading.Lock()
+
+    def notify(self, title: str, previous_price: float, price: float, asin: str, url: str, reason: str = 'threshold'):
+        with self._lock:
+            self.drops.append(make_drop(title, previous_price, price, asin, url, reason))
+
+    def take(self) -> List[Dict]:
+        with self._lock:
+            drops, self.drops = self.drops, []
+        return drops
+
+
+class NotificationDispatcher:
+    """
+    Delivers price drop notifications from a background thread.
+
+    Scrapers only enqueue drops, so a notification that blocks (like the
+    desktop popup waiting to be dismissed) never stalls a crawl. Each
+    `digest()` block collects the drops notified to its own Digest and
+    delivers them together when it exits, so crawls running at the same
+    time do not wait for each other's digest.
+    """
+
+    def __init__(self, sinks: List[NotificationSink]):
+        self.sinks = sinks
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+        self._thread.start()
+
+    def notify(self, title: str, previous_price: float, price: float, asin: str, url: str, reason: str = 'threshold'):
+        """Queue a price drop notification. `reason` names the rule that fired ('threshold' or 'lowest_<N>d')."""
+        self._queue.put([make_drop(title, previous_price, price, asin, url, reason)])
+
+    @contextmanager
+    def digest(self):
+        """Yield a Digest whose drops are delivered as one notification when the block exits."""
+        digest = Digest()
+        try:
+            yield digest
+        finally:
+            drops = digest.take()
+            if drops:
+                self._queue.put(drops)
+
+    def _run(self):
+        while True:
+            drops = self._queue.get()
+            try:
+                for sink in self.sinks:
+                    name = type(sink).__name__
+                    try:
+                        with get_metrics().timer('notification_seconds', sink=name):
+                            sink.send(drops)
+                        get_metrics().inc('notifications_total', len(drops), sink=name)
+                    except Exception as e:
+                        get_metrics().inc('notification_errors_total', sink=name)
+                        logger.error(f"Error sending notification with {name}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait until every queued notification has been delivered. Returns False on timeout."""
+        done = threading.Event()
+        waiter = threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True)
+        waiter.start()
+        return done.wait(timeout)
+
+
+def is_headless() -> bool:
+    """Return whether this process runs without a display (HEADLESS, or detected when it is None)."""
+    if HEADLESS is not None:
+        return bool(HEADLESS)
+    if sys.platform.startswith('linux'):
+        return not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return False
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """Return the process-wide dispatcher using the sinks listed in NOTIFICATION_SINKS."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            sinks = []
+            names = list(NOTIFICATION_SINKS)
+            if 'desktop' in names and is_headless():
+                logger.info("Running headless, desktop notifications are written to stdout instead.")
+                names = [name for name in names if name != 'desktop']
+                if 'stdout' not in names:
+                    names.append('stdout')
+            for name in names:
+                if name in SINKS:
+                    sinks.append(SINKS[name]())
+                else:
+                    logger.warning(f"Unknown notification sink '{name}' ignored.")
+            _dispatcher = NotificationDispatcher(sinks)
+            # Give pending notifications a chance to go out before the process exits
+            atexit.register(_dispatcher.join, 10)
+        return _dispatcher
@@ -0,0 +1,147 @@
+import multiprocessing
+import pickle
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin
+from logs import logger
+from config import PARSE_WORKERS
+from .extractors import extract_listing, extract_listing_cards, extract_product
+from .urls import extract_asin
+from .metrics import get_metrics
+from .records import ProductRecord, parse_price
+
+
+def parse_product_page(html: str, url: str) -> Optional[ProductRecord]:
+    """
+    Turn a product page into a compact product record.
+
+    Runs in the parse workers, so it only depends on the page and the URL.
+
+    Returns:
+    - ProductRecord with title, price, rating, image, canonical url and asin, or None if the page could not be parsed
+    """
+    fields = extract_product(html)
+
+    title = fields['title'].strip() if fields['title'] is not None else None
+
+    price = parse_price(fields['price'])
+    if fields['price'] is not None and price is None:
+        logger.error(f"Error parsing price for {title}")
+        return None
+
+    asin = extract_asin(url)
+
+    if title is None or price is None or asin is None:
+        logger.error(f'Error in getting product title: {url}')
+        return None
+
+    return ProductRecord(asin, title, price, fields['rating'], fields['image'], url)
+
+
+def parse_listing_page(html: str) -> Tuple[List[str], Optional[str]]:
+    """Return the product hrefs and the next page href of a listing page."""
+    return extract_listing(html)
+
+
+def parse_listing_cards_page(html: str, url: str) -> Tuple[List[ProductRecord], List[str]]:
+    """
+    Turn the result cards of a listing page into product records.
+
+    A card only gives a record when it has a title and a price, and an ASIN
+    shown on several cards with different prices is not trusted at all.
+
+    Returns:
+    - Tuple of the records (one per ASIN) and the ASINs whose cards were ambiguous
+    """
+    records, ambiguous = {}, set()
+    for card in extract_listing_cards(html):
+        asin = (card['asin'] or '').strip().upper()
+        if not asin:
+            continue
+        title = card['title'].strip() if card['title'] is not None else None
+        price = parse_price(card['price'])
+        if not title or price is None:
+            ambiguous.add(asin)
+            continue
+        previous = records.get(asin)
+        if previous is not None and previous.price != price:
+            ambiguous.add(asin)
+        records[asin] = ProductRecord(asin, title, price, card['rating'], card['image'], urljoin(url, f'/dp/{asin}'))
+    return [record for asin, record in records.items() if asin not in ambiguous], sorted(ambiguous)
+
+
+def _gil_disabled() -> bool:
+    """True on free-threaded Python builds running without the GIL."""
+    return hasattr(sys, '_is_gil_enabled') and not sys._is_gil_enabled()
+
+
+class ParsePool:
+    """
+    Parsing stage that runs HTML extraction on all cores.
+
+    Fetch workers hand raw page bodies to the pool and get compact records
+    back, so the number of fetch threads and parse workers scale
+    independently. With `workers=0` pages are parsed in the calling thread.
+    On free-threaded Python a thread pool is used instead of processes.
+    """
+
+    def __init__(self, workers: int = PARSE_WORKERS):
+        self.workers = max(0, int(workers))
+        self._executor = self._new_executor() if self.workers else None
+        self._executor_lock = threading.Lock()
+
+    def _new_executor(self):
+        if _gil_disabled():
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+        # Workers are spawned rather than forked because the fetch threads are already running
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _run(self, fn, *args):
+        executor = self._executor
+        if executor is None:
+            return fn(*args)
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool as e:
+            # A worker died (killed, out of memory): the page is not lost, and the next pages get a new pool
+            logger.error(f"Parse worker died ({e}). Parsing in the calling thread and restarting the pool.")
+            with self._executor_lock:
+                if self._executor is executor:
+                    executor.shutdown(wait=False)
+                    self._executor = self._new_executor()
+            return fn(*args)
+        except pickle.PicklingError as e:
+            logger.error(f"Page could not be sent to a parse worker ({e}). Parsing in the calling thread.")
+            return fn(*args)
+
+    def parse_product(self, html: str, url: str) -> Optional[ProductRecord]:
+        with get_metrics().timer('parse_seconds', kind='product'):
+            return self._run(parse_product_page, html, url)
+
+    def parse_listing(self, html: str) -> Tuple[List[str], Optional[str]]:
+        with get_metrics().timer('parse_seconds', kind='listing'):
+            return self._run(parse_listing_page, html)
+
+    def parse_listing_cards(self, html: str, url: str) -> Tuple[List[ProductRecord], List[str]]:
+        with get_metrics().timer('parse_seconds', kind='cards'):
+            return self._run(parse_listing_cards_page, html, url)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParsePool:
+    """Return the process-wide parse pool."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ParsePool(PARSE_WORKERS)
+        return _parse_pool
@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from logs import logger
+from config import FETCH_CONCURRENCY, PIPELINE_QUEUE_SIZE, HISTORY_BATCH_SIZE, RETRY_MAX_ATTEMPTS
+from .retry_scheduler import DelayQueue, FetchFailed, RetryLater
+
+# Marker telling a fetch worker that the producer is done
+_DONE = object()
+
+
+class BatchedSink:
+    """
+    Bounded buffer for scraped records.
+
+    Records are handed to `write` in batches of `batch_size`, so a crawl keeps
+    at most one batch in memory and persists it with a single append. A batch
+    is a list, or whatever `batch_factory` builds (anything with append and len).
+    With `max_wait`, the batch is also written once its oldest record has
+    waited that many seconds. A record can come with an `on_written` callback,
+    called with True once its batch is written, or False if `write` failed.
+    """
+
+    def __init__(self, write: Callable[[List[Dict]], None], batch_size: int = HISTORY_BATCH_SIZE, batch_factory: Callable = list, max_wait: Optional[float] = None):
+        self.write = write
+        self.batch_size = max(1, int(batch_size))
+        self.batch_factory = batch_factory
+        self.max_wait = max_wait
+        self.total = 0
+        self._buffer = batch_factory()
+        self._callbacks = []
+        self._oldest = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict, on_written: Optional[Callable[[bool], None]] = None):
+        batch = None
+        with self._lock:
+            if not len(self._buffer):
+                self._oldest = time.monotonic()
+            self._buffer.append(record)
+            if on_written is not None:
+                self._callbacks.append(on_written)
+            self.total += 1
+            if len(self._buffer) >= self.batch_size or self._stale():
+                batch, callbacks = self._take()
+        if batch is not None:
+            self._write(batch, callbacks)
+
+    def flush(self, stale_only: bool = False):
+        """Write the buffered records (with `stale_only`, only if the oldest one waited `max_wait` seconds)."""
+        with self._lock:
+            if stale_only and not self._stale():
+                return
+            batch, callbacks = self._take()
+        if len(batch):
+            self._write(batch, callbacks)
+
+    def _stale(self) -> bool:
+        return self.max_wait is not None and len(self._buffer) > 0 and time.monotonic() - self._oldest >= self.max_wait
+
+    def _take(self):
+        batch, callbacks = self._buffer, self._callbacks
+        self._buffer, self._callbacks = self.batch_factory(), []
+        return batch, callbacks
+
+    def _write(self, batch, callbacks: List[Callable[[bool], None]]):
+        try:
+            self.write(batch)
+            written = True
+        except Exception as e:
+            logger.error(f"Error writing a batch of {len(batch)} records: {e}")
+            written = False
+        for callback in callbacks:
+            try:
+                callback(written)
+            except Exception as e:
+                logger.error(f"Write callback failed: {e}")
+
+
+def run_pipeline(urls: Iterable[str], process: Callable[..., Optional[Dict]], sink: BatchedSink, workers: int = FETCH_CONCURRENCY, queue_size: int = PIPELINE_QUEUE_SIZE, max_attempts: int = RETRY_MAX_ATTEMPTS, on_failure: Optional[Callable[[str], None]] = None) -> int:
+    """
+    Stream URLs through fetch workers into a sink.
+
+    When `process` raises RetryLater, the URL is parked on a delay queue and
+    put back on the work queue once its backoff expires, so the worker moves
+    on to the next URL instead of sleeping. The retry calls
+    `process(url, retry=<the RetryLater>)` so the fetch resumes where it
+    stopped. Retries raised without a request (circuit open) are not counted
+    as attempts. A URL is given up after `max_attempts` attempts, or as soon
+    as `process` raises FetchFailed or any other error.
+
+    Parameters:
+    - urls: Producer of URLs (usually a generator walking listing pages)
+    - process: Function turning a URL into a record, or None if nothing was scraped
+    - sink: Where the records are collected
+    - workers: Number of fetch workers consuming the queue
+    - queue_size: Maximum number of URLs waiting for a worker (the producer blocks when it is full)
+    - max_attempts: Attempts per URL before it is given up
+    - on_failure: Called with every URL that is given up
+
+    Returns:
+    - Number of records handed to the sink
+    """
+    work = queue.Queue(maxsize=max(1, queue_size))
+    delayed = DelayQueue(work.put)
+    produced = sink.total
+    attempts = {}
+    # RetryLater raised by the last attempt of every URL waiting to be retried
+    retry_states = {}
+    # URLs taken from the producer that are not finished yet (queued, in flight or waiting to be retried)
+    pending = 0
+    pending_changed = threading.Condition()
+
+    def give_up(url):
+        if on_failure:
+            try:
+                on_failure(url)
+            except Exception as e:
+                logger.error(f"Failure callback for {url} failed: {e}")
+
+    def consume():
+        nonlocal pending
+        while True:
+            url = work.get()
+            if url is _DONE:
+                return
+            try:
+                retry = retry_states.pop(url, None)
+                record = process(url) if retry is None else process(url, retry=retry)
+                if record:
+                    sink.add(record)
+            except RetryLater as e:
+                attempt = attempts.get(url, 1)
+                if not e.charged or attempt < max_attempts:
+                    if e.charged:
+                        attempts[url] = attempt + 1
+                        logger.warning(f"Retrying {url} in {e.delay:.1f} sec (attempt {attempt + 1} of {max_attempts}).")
+                    retry_states[url] = e
+                    delayed.schedule(url, e.delay)
+                    continue
+                logger.error(f"Failed to fetch URL: {url}. Max retries exceeded.")
+                give_up(url)
+            except FetchFailed:
+                # The fetch gave up on its own (and logged why)
+                give_up(url)
+            except Exception as e:
+                logger.error(f"Error processing {url}: {e}")
+                give_up(url)
+            attempts.pop(url, None)
+            with pending_changed:
+                pending -= 1
+                pending_changed.notify_all()
+
+    threads = [threading.Thread(target=consume, name=f'pipeline-{i}', daemon=True) for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for url in urls:
+            with pending_changed:
+                pending += 1
+            work.put(url)
+        # Retries are put back on the queue by the delay queue, wait for them too
+        with pending_changed:
+            pending_changed.wait_for(lambda: pending == 0)
+    finally:
+        delayed.close()
+        for _ in threads:
+            work.put(_DONE)
+        for thread in threads:
+            thread.join()
+        sink.flush()
+
+    return sink.total - produced
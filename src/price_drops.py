@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from logs import logger
+from config import (
+    PRICE_DROP_MODE,
+    PRICE_DROP_THRESHOLD,
+    PRICE_DROP_ASIN_THRESHOLDS,
+    PRICE_DROP_CATEGORIES,
+    PRICE_DROP_CATEGORY_THRESHOLDS,
+    PRICE_DROP_LOWEST_DAYS,
+)
+from .history_store import HistoryStore, get_history_store
+from .price_index import LatestPriceIndex, get_price_index
+from .records import RecordBatch
+
+# Columns of the drops returned by detect_price_drops
+DROP_COLUMNS = ['title', 'previous_price', 'price', 'asin', 'url', 'reason']
+
+
+class PriceDropRules:
+    """
+    Thresholds deciding which price changes are drops.
+
+    Every ASIN is checked against one (mode, threshold) pair: its own entry in
+    `asin_thresholds`, else the entry of its category, else the default.
+    In 'value' mode a drop is a price at least `threshold` dollars below the
+    previous one, in 'percentage' mode at least `threshold` percent below.
+    With `lowest_days`, a price lower than every price of the last
+    `lowest_days` days is reported as well.
+    """
+
+    def __init__(self, mode: str = PRICE_DROP_MODE, threshold: float = PRICE_DROP_THRESHOLD,
+                 asin_thresholds: Optional[Dict[str, Tuple[str, float]]] = None,
+                 categories: Optional[Dict[str, List[str]]] = None,
+                 category_thresholds: Optional[Dict[str, Tuple[str, float]]] = None,
+                 lowest_days: int = PRICE_DROP_LOWEST_DAYS):
+        self.mode = mode
+        self.threshold = float(threshold)
+        self.asin_thresholds = PRICE_DROP_ASIN_THRESHOLDS if asin_thresholds is None else asin_thresholds
+        self.category_thresholds = PRICE_DROP_CATEGORY_THRESHOLDS if category_thresholds is None else category_thresholds
+        categories = PRICE_DROP_CATEGORIES if categories is None else categories
+        self.asin_categories = {asin: category for category, asins in categories.items() for asin in asins}
+        self.lowest_days = lowest_days
+
+    def thresholds(self, asins: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """Return the mode and threshold applying to each ASIN."""
+        modes = pd.Series(self.mode, index=asins.index, dtype=object)
+        thresholds = pd.Series(self.threshold, index=asins.index, dtype=float)
+        # Category thresholds first, so ASIN thresholds override them
+        for rule in (asins.map(self.asin_categories).map(self.category_thresholds), asins.map(self.asin_thresholds)):
+            has_rule = rule.notna()
+            if has_rule.any():
+                modes[has_rule] = rule[has_rule].map(lambda pair: pair[0])
+                thresholds[has_rule] = rule[has_rule].map(lambda pair: float(pair[1]))
+        return modes, thresholds
+
+
+def detect_price_drops(records: Union[List[Dict], RecordBatch], rules: Optional[PriceDropRules] = None, index: Optional[LatestPriceIndex] = None,
+                       store: Optional[HistoryStore] = None, now: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Find the price drops in a batch of scraped products.
+
+    The batch is joined against the latest known prices and the thresholds are
+    evaluated on whole columns, so checking thousands of products costs a few
+    array operations. Must run before the batch is added to the history.
+
+    Parameters:
+    - records: Scraped products (a RecordBatch, or dicts with asin, title, price and url)
+    - rules: Thresholds to apply (defaults to the PRICE_DROP_* settings)
+    - index / store: Latest-price index and history store (default to the process-wide ones)
+    - now: Time the batch was scraped, for the rolling window rule
+
+    Returns:
+    - DataFrame with one row per drop and the columns of DROP_COLUMNS
+    """
+    rules = rules or PriceDropRules()
+    index = index or get_price_index()
+    if isinstance(records, RecordBatch):
+        df = pd.DataFrame({'asin': records.asin, 'title': records.title, 'price': np.frombuffer(records.price), 'url': records.url})
+    else:
+        df = pd.DataFrame(records, columns=['asin', 'title', 'price', 'url'])
+    df = df[df['asin'].notna() & df['price'].notna()].drop_duplicates(subset='asin', keep='last')
+    if df.empty:
+        return pd.DataFrame(columns=DROP_COLUMNS)
+    df = df.reset_index(drop=True)
+    df['price'] = df['price'].astype(float)
+    df['previous_price'] = df['asin'].map(index.get_many(df['asin'].tolist())).astype(float)
+
+    modes, thresholds = rules.thresholds(df['asin'])
+    limits = np.where(
+        modes == 'value',
+        df['previous_price'] - thresholds,
+        df['previous_price'] * (1 - thresholds / 100),
+    )
+    threshold_drop = df['previous_price'].notna() & (df['price'] <= limits)
+    unknown = ~modes.isin(['value', 'percentage'])
+    if unknown.any():
+        logger.warning(f"Unknown price drop mode(s) {sorted(set(modes[unknown]))} ignored.")
+        threshold_drop &= ~unknown
+    df['reason'] = np.where(threshold_drop, 'threshold', None)
+
+    if rules.lowest_days:
+        store = store or get_history_store()
+        since = ((now or datetime.now()) - timedelta(days=rules.lowest_days)).strftime('%Y-%m-%d %H:%M:%S')
+        window_low = df['asin'].map(store.min_prices_since(since, df['asin'].tolist())).astype(float)
+        lowest = window_low.notna() & (df['price'] < window_low) & ~threshold_drop
+        df.loc[lowest, 'reason'] = f'lowest_{rules.lowest_days}d'
+
+    return df.loc[df['reason'].notna(), DROP_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,72 @@
+import threading
+from typing import Dict, List, Optional, Union
+from logs import logger
+from .history_store import HistoryStore, get_history_store
+from .records import RecordBatch
+
+
+class LatestPriceIndex:
+    """
+    Process-wide index of the latest known price per ASIN.
+
+    The index is built from the history store on first use, updated in place
+    whenever new rows are persisted, and rebuilt if the history is modified
+    outside of this process (detected through the store signature).
+    """
+
+    def __init__(self, store: HistoryStore):
+        self._store = store
+        self._prices: Optional[Dict[str, float]] = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        self._prices = self._store.latest_prices()
+        self._signature = self._store.signature()
+        logger.info(f"Built latest-price index for {len(self._prices)} products.")
+
+    def get(self, asin: str) -> Optional[float]:
+        """Return the latest known price for an ASIN, or None if it has no history."""
+        with self._lock:
+            if self._prices is None or self._store.signature() != self._signature:
+                self._rebuild()
+            return self._prices.get(asin)
+
+    def get_many(self, asins: List[str]) -> Dict[str, float]:
+        """Return the latest known prices of several ASINs (ASINs without history are left out)."""
+        with self._lock:
+            if self._prices is None or self._store.signature() != self._signature:
+                self._rebuild()
+            return {asin: self._prices[asin] for asin in asins if asin in self._prices}
+
+    def update(self, records: Union[List[Dict], RecordBatch]):
+        """Record rows that were just appended to the history store."""
+        with self._lock:
+            if self._prices is None:
+                return  # Built lazily on the next lookup
+            if isinstance(records, RecordBatch):
+                self._prices.update(zip(records.asin, records.price))
+            else:
+                for record in records:
+                    if record.get('asin') is not None and record.get('price') is not None:
+                        self._prices[record['asin']] = record['price']
+            self._signature = self._store.signature()
+
+    def invalidate(self):
+        """Drop the index so it is rebuilt from the history on the next lookup."""
+        with self._lock:
+            self._prices = None
+            self._signature = None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_price_index() -> LatestPriceIndex:
+    """Return the process-wide latest-price index for the configured history store."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LatestPriceIndex(get_history_store())
+        return _index
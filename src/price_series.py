@@ -0,0 +1,36 @@
+from typing import List, Tuple
+from config import CHART_MAX_POINTS
+from .history_store import get_history_store
+
+
+def downsample_minmax(timestamps: List, prices: List[float], max_points: int = CHART_MAX_POINTS) -> Tuple[List, List[float]]:
+    """
+    Reduce a price series to at most `max_points` points.
+
+    The series is split into buckets of consecutive points and only the lowest
+    and highest price of each bucket are kept (in time order), so every price
+    spike and dip stays visible on the chart.
+    """
+    if max_points < 2 or len(prices) <= max_points:
+        return timestamps, prices
+
+    buckets = max_points // 2
+    size = len(prices) / buckets
+    sampled_timestamps, sampled_prices = [], []
+    for bucket in range(buckets):
+        start, end = int(bucket * size), int((bucket + 1) * size)
+        if start >= end:
+            continue
+        window = range(start, end)
+        low = min(window, key=prices.__getitem__)
+        high = max(window, key=prices.__getitem__)
+        for index in sorted({low, high}):
+            sampled_timestamps.append(timestamps[index])
+            sampled_prices.append(prices[index])
+    return sampled_timestamps, sampled_prices
+
+
+def get_price_series(asin: str, max_points: int = CHART_MAX_POINTS) -> Tuple[List, List[float]]:
+    """Return the price history of one ASIN in time order, downsampled to `max_points`."""
+    timestamps, prices = get_history_store().history(asin)
+    return downsample_minmax(timestamps, prices, max_points)
@@ -0,0 +1,76 @@
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import urlparse
+from config import HOST_REQUESTS_PER_SECOND, HOST_BURST
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at `rate` tokens per second up to `capacity` tokens.
+
+    Waiting callers are served by priority, then in arrival order, so a
+    high-priority caller only waits for the next token, not behind every
+    lower-priority request already queued.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._changed = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int = 0):
+        """Block until a token is available and this caller is the first waiter with the highest priority."""
+        with self._changed:
+            waiter = (-priority, next(self._counter))
+            heapq.heappush(self._waiters, waiter)
+            while True:
+                self._refill()
+                if self._waiters[0] == waiter:
+                    if self._tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        # The next waiter is now at the head of the queue
+                        self._changed.notify_all()
+                        return
+                    self._changed.wait((1 - self._tokens) / self.rate)
+                else:
+                    # Woken up whenever a waiter is served
+                    self._changed.wait()
+
+
+class HostRateLimiter:
+    """Keeps one token bucket per host so every caller shares the same politeness budget."""
+
+    def __init__(self, rate: float = HOST_REQUESTS_PER_SECOND, burst: float = HOST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str, priority: int = 0):
+        """Block until a request to the host of `url` is allowed (callers with a higher priority go first)."""
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        bucket.acquire(priority)
+
+
+_rate_limiter = HostRateLimiter()
+
+
+def get_rate_limiter() -> HostRateLimiter:
+    """Return the process-wide per-host rate limiter."""
+    return _rate_limiter
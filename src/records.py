@@ -0,0 +1,132 @@
+import re
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+import numpy as np
+import pandas as pd
+from .urls import canonicalize_product_url
+
+_RATING_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+
+def parse_rating(text: Optional[str]) -> Optional[float]:
+    """Turn a rating such as '4.5 out of 5 stars' (or a number) into a float, or None."""
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return None if text != text else float(text)  # NaN means no rating
+    match = _RATING_PATTERN.search(text)
+    return float(match.group()) if match else None
+
+
+def parse_price(text: Optional[str]) -> Optional[float]:
+    """Turn a displayed price such as '$1,299.99' into a float, or None if it is not a number."""
+    if text is None:
+        return None
+    try:
+        return float(text.strip().replace('$', '').replace(',', ''))
+    except ValueError:
+        return None
+
+
+class ProductRecord:
+    """
+    One scraped product.
+
+    Uses __slots__ and typed fields: price and rating are floats, the ASIN is
+    interned (it repeats in every batch and index), and the URL is reduced to
+    its canonical /dp/<ASIN> form.
+    """
+
+    __slots__ = ('asin', 'title', 'price', 'rating', 'image', 'url')
+
+    def __init__(self, asin: str, title: str, price: float, rating: Optional[float] = None,
+                 image: Optional[str] = None, url: Optional[str] = None):
+        self.asin = sys.intern(asin)
+        self.title = title
+        self.price = float(price)
+        self.rating = parse_rating(rating)
+        self.image = image
+        self.url = canonicalize_product_url(url) if url else None
+
+    def __reduce__(self):
+        # Rebuilt through __init__ so records coming back from a parse worker are interned again
+        return (ProductRecord, (self.asin, self.title, self.price, self.rating, self.image, self.url))
+
+    def __repr__(self):
+        return f'ProductRecord(asin={self.asin!r}, price={self.price!r}, title={self.title[:40]!r})'
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ProductRecord':
+        return cls(data['asin'], data.get('title'), data['price'], data.get('rating'), data.get('image'), data.get('url'))
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RecordBatch:
+    """
+    Columnar batch of product records.
+
+    Records are appended field by field into one list per text column and
+    one float array per numeric column, so a batch never holds a dict per
+    product. The history stores take the columns directly (see to_frame).
+    """
+
+    def __init__(self):
+        self.asin: List[str] = []
+        self.title: List[Optional[str]] = []
+        self.price = array('d')
+        self.rating = array('d')
+        self.image: List[Optional[str]] = []
+        self.url: List[Optional[str]] = []
+        self.timestamp: List[Optional[str]] = []
+
+    def __len__(self):
+        return len(self.asin)
+
+    def append(self, record: Union[ProductRecord, Dict], timestamp: Optional[str] = None):
+        if isinstance(record, dict):
+            timestamp = record.get('timestamp', timestamp)
+            record = ProductRecord.from_dict(record)
+        self.asin.append(record.asin)
+        self.title.append(record.title)
+        self.price.append(record.price)
+        self.rating.append(float('nan') if record.rating is None else record.rating)
+        self.image.append(record.image)
+        self.url.append(record.url)
+        self.timestamp.append(timestamp)
+
+    def stamp(self, timestamp: str):
+        """Set the timestamp of every record that has none."""
+        self.timestamp = [timestamp if value is None else value for value in self.timestamp]
+
+    @classmethod
+    def from_records(cls, records: Iterable[Union[ProductRecord, Dict, None]]) -> 'RecordBatch':
+        batch = cls()
+        for record in records:
+            if record:
+                batch.append(record)
+        return batch
+
+    def columns(self) -> Dict[str, Union[list, array]]:
+        return {
+            'asin': self.asin,
+            'title': self.title,
+            'price': self.price,
+            'rating': self.rating,
+            'image': self.image,
+            'url': self.url,
+            'timestamp': self.timestamp,
+        }
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the batch as a DataFrame built column by column (the float arrays are not copied per row)."""
+        return pd.DataFrame({
+            name: np.frombuffer(values, dtype=np.float64) if isinstance(values, array) else values
+            for name, values in self.columns().items()
+        })
+
+    def __iter__(self) -> Iterator[ProductRecord]:
+        for asin, title, price, rating, image, url in zip(self.asin, self.title, self.price, self.rating, self.image, self.url):
+            yield ProductRecord(asin, title, price, rating, image, url)
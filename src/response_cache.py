@@ -0,0 +1,265 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from logs import logger
+from config import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_DIR, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES
+
+# Anchors of the fingerprinted regions, with the number of characters after the anchor that make up the region
+_TITLE_REGION = (re.compile(r'id="productTitle"'), 300)
+# The price blocks (apex and buy box) read by the extractors; a list price row can come before the price to pay
+_PRICE_BLOCK_REGIONS = [
+    (re.compile(r'id="corePriceDisplay_desktop_feature_div"'), 1500),
+    (re.compile(r'id="corePrice_desktop"'), 1500),
+    (re.compile(r'id="corePrice_feature_div"'), 1500),
+]
+# Only used on pages without a price block
+_LOOSE_PRICE_REGION = (re.compile(r'class="a-offscreen"'), 300)
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache with a TTL and LRU size eviction.
+
+    Bodies are stored as one file per URL next to an index with their ETag,
+    Last-Modified, size and access time. Responses younger than `ttl`
+    seconds are served without a request; older ones are revalidated with
+    If-None-Match / If-Modified-Since when the server sent those headers.
+
+    The index is written at most every `save_interval` seconds and at exit,
+    so storing a page costs one file write instead of rewriting the index.
+    """
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, ttl: float = RESPONSE_CACHE_TTL, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 save_interval: float = 5.0):
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.save_interval = save_interval
+        self._index_path = os.path.join(self.directory, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._index = self._load_index()
+        self._size = sum(entry['size'] for entry in self._index.values())
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._remove_orphans()
+        atexit.register(self.flush)
+
+    def _load_index(self) -> "OrderedDict[str, Dict]":
+        try:
+            with open(self._index_path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return OrderedDict()
+        # Least recently used first
+        return OrderedDict(sorted(entries.items(), key=lambda item: item[1]['last_access']))
+
+    def _remove_orphans(self):
+        # Bodies stored after the last index write of a process that did not exit cleanly
+        for name in os.listdir(self.directory):
+            if name.endswith('.html') and name[:-len('.html')] not in self._index:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _index_changed(self):
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self._save_index()
+
+    def flush(self):
+        """Write the index if it changed since the last write."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.html')
+
+    def _read_body(self, key: str) -> Optional[str]:
+        try:
+            with open(self._body_path(key), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            self._drop(key)
+            return None
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry['size']
+        try:
+            os.remove(self._body_path(key))
+        except FileNotFoundError:
+            pass
+        self._index_changed()
+
+    def _touch(self, key: str):
+        self._index[key]['last_access'] = time.time()
+        self._index.move_to_end(key)
+
+    def get_fresh(self, url: str) -> Optional[str]:
+        """Return the cached body if it is younger than the TTL."""
+        key = self._key(url)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or time.time() - entry['stored_at'] >= self.ttl:
+                return None
+            body = self._read_body(key)
+            if body is not None:
+                self._touch(key)
+            return body
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Return the validators to send for a cached URL."""
+        with self._lock:
+            entry = self._index.get(self._key(url))
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, url: str) -> Optional[str]:
+        """Handle a 304 Not Modified response: renew the entry and return the cached body."""
+        key = self._key(url)
+        with self._lock:
+            if key not in self._index:
+                return None
+            body = self._read_body(key)
+            if body is not None:
+                self._index[key]['stored_at'] = time.time()
+                self._touch(key)
+                self._index_changed()
+            return body
+
+    def forget(self, url: str) -> None:
+        """Drop a cached URL and its validators."""
+        with self._lock:
+            self._drop(self._key(url))
+
+    def store(self, url: str, body: str, headers) -> None:
+        """Cache a response body with its validators and evict the least recently used entries if needed."""
+        key = self._key(url)
+        encoded = body.encode('utf-8')
+        now = time.time()
+        with self._lock:
+            with open(self._body_path(key), 'wb') as f:
+                f.write(encoded)
+            previous = self._index.get(key)
+            if previous is not None:
+                self._size -= previous['size']
+            self._size += len(encoded)
+            self._index[key] = {
+                'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'size': len(encoded),
+                'stored_at': now,
+                'last_access': now,
+            }
+            self._index.move_to_end(key)
+            self._evict()
+            self._index_changed()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key, entry = self._index.popitem(last=False)
+            self._size -= entry['size']
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted {entry['url']} from the response cache.")
+
+
+class PriceRegionFingerprints:
+    """
+    Remembers a fingerprint of the title and price markup of each product page.
+
+    The fingerprint is computed with a couple of substring searches, so an
+    unchanged page can be detected before it is parsed. A fingerprint is only
+    remembered once its page was parsed, and forgotten if its record could not
+    be stored, so a page is never skipped while its price is missing.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._fingerprints = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(html: str) -> Optional[str]:
+        """Return a digest of the title and price regions, or None if the page shows no price to compare."""
+        digest = hashlib.sha1()
+        found_price = False
+        for index, (pattern, length) in enumerate([_TITLE_REGION] + _PRICE_BLOCK_REGIONS + [_LOOSE_PRICE_REGION]):
+            if index == len(_PRICE_BLOCK_REGIONS) + 1 and found_price:
+                break
+            match = pattern.search(html)
+            if match:
+                found_price = found_price or index > 0
+                digest.update(html[match.start():match.start() + length].encode('utf-8'))
+        return digest.hexdigest() if found_price else None
+
+    def matches(self, url: str, fingerprint: Optional[str]) -> bool:
+        """Return True if `fingerprint` is the one remembered for the page."""
+        if fingerprint is None:
+            return False
+        with self._lock:
+            return self._fingerprints.get(url) == fingerprint
+
+    def remember(self, url: str, fingerprint: Optional[str]):
+        if fingerprint is None:
+            return
+        with self._lock:
+            self._fingerprints[url] = fingerprint
+            self._fingerprints.move_to_end(url)
+            if len(self._fingerprints) > self.max_entries:
+                self._fingerprints.popitem(last=False)
+
+    def forget(self, url: str):
+        with self._lock:
+            self._fingerprints.pop(url, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_fingerprints = PriceRegionFingerprints()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None if it is disabled."""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def get_price_fingerprints() -> PriceRegionFingerprints:
+    """Return the process-wide price region fingerprints."""
+    return _fingerprints
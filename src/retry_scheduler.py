@@ -0,0 +1,259 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlparse
+from logs import logger
+from config import (
+    RETRY_MAX_DELAY,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MIN,
+    RETRY_BUDGET_WINDOW,
+    CIRCUIT_503_THRESHOLD,
+    CIRCUIT_MIN_REQUESTS,
+    CIRCUIT_WINDOW,
+    CIRCUIT_OPEN_SECONDS,
+)
+
+
+class RetryLater(Exception):
+    """
+    Raised by a deferred fetch that should be retried after `delay` seconds.
+
+    The exception is handed back to the fetch when it is retried, so it
+    resumes at `next_attempt` (keeping the exponential backoff growing) and
+    avoids `identity`, the identity that just failed. `charged` is False when
+    no request was made (the host's circuit was open), so the retry does not
+    count against the caller's attempts.
+    """
+
+    def __init__(self, delay: float, next_attempt: int = 0, identity=None, charged: bool = True):
+        super().__init__(f"Retry in {delay:.1f} sec")
+        self.delay = delay
+        self.next_attempt = next_attempt
+        self.identity = identity
+        self.charged = charged
+
+
+class FetchFailed(Exception):
+    """Raised by a deferred fetch that gave up, so the caller can tell a failed fetch from an empty result."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the number of seconds asked for by a Retry-After header (seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """
+    Sliding-window retry budget.
+
+    Within `window` seconds, retries may not exceed `ratio` times the number
+    of requests plus a floor of `minimum`. A failing host therefore cannot
+    turn every request into a chain of retries.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, minimum: int = RETRY_BUDGET_MIN, window: float = RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self, now: float):
+        self._trim(now)
+        self._requests.append(now)
+
+    def can_retry(self, now: float) -> bool:
+        self._trim(now)
+        return len(self._retries) < self.minimum + self.ratio * len(self._requests)
+
+    def spend(self, now: float):
+        self._retries.append(now)
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host while it answers with too many 503s.
+
+    The circuit opens when at least `min_requests` requests were made in the
+    last `window` seconds and the share of 503 responses exceeds
+    `threshold`. After `open_seconds` a single probe request is let through:
+    if it succeeds the circuit closes, otherwise it opens again. Results of
+    requests that were already in flight when the circuit opened are ignored.
+    """
+
+    def __init__(self, threshold: float = CIRCUIT_503_THRESHOLD, min_requests: int = CIRCUIT_MIN_REQUESTS,
+                 window: float = CIRCUIT_WINDOW, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self._outcomes = deque()
+        self._open_until = 0.0
+        self._probing = False
+
+    def delay(self, now: float) -> Tuple[float, bool]:
+        """Return how long a request has to wait before it may be sent (0 when allowed), and whether it is the probe."""
+        if now < self._open_until:
+            return self._open_until - now, False
+        if self._open_until:
+            # Half-open: one probe at a time
+            if self._probing:
+                return 1.0, False
+            self._probing = True
+            return 0.0, True
+        return 0.0, False
+
+    def cancel_probe(self):
+        """Let another request probe the host, the probe was not sent."""
+        self._probing = False
+
+    def record(self, now: float, unavailable: bool, probe: bool = False):
+        if self._open_until:
+            if not probe:
+                # Sent before the circuit opened, it says nothing about the host now
+                return
+            self._probing = False
+            if unavailable:
+                self._open_until = now + self.open_seconds
+                logger.warning(f"Circuit still open after probe, pausing requests for {self.open_seconds} sec.")
+            else:
+                self._open_until = 0.0
+                self._outcomes.clear()
+                logger.info("Circuit closed, requests resumed.")
+            return
+
+        self._outcomes.append((now, unavailable))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+        failures = sum(1 for _, failed in self._outcomes if failed)
+        if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) > self.threshold:
+            self._open_until = now + self.open_seconds
+            logger.warning(f"{failures} of the last {len(self._outcomes)} requests returned 503. Circuit open for {self.open_seconds} sec.")
+
+
+class RetryScheduler:
+    """
+    Decides when a failed request may be retried.
+
+    Keeps a retry budget and a circuit breaker per host plus a global retry
+    budget, and computes exponential, jittered backoff delays that honor
+    Retry-After.
+    """
+
+    def __init__(self, max_delay: float = RETRY_MAX_DELAY):
+        self.max_delay = max_delay
+        self._hosts = {}
+        self._global_budget = RetryBudget()
+        self._lock = threading.Lock()
+
+    def _host(self, url: str):
+        host = urlparse(url).netloc
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = (RetryBudget(), CircuitBreaker())
+        return state
+
+    def before_request(self, url: str) -> Tuple[float, bool]:
+        """
+        Return how long to wait because the host's circuit is open (0 means send now, and the request is counted),
+        and whether the request is the probe of a half-open circuit (pass it back to record_result).
+        """
+        now = time.time()
+        with self._lock:
+            budget, breaker = self._host(url)
+            delay, probe = breaker.delay(now)
+            if delay == 0:
+                budget.record_request(now)
+                self._global_budget.record_request(now)
+            return delay, probe
+
+    def record_result(self, url: str, unavailable: bool, probe: bool = False):
+        """Feed the circuit breaker with the outcome of a request (unavailable means a 503)."""
+        with self._lock:
+            self._host(url)[1].record(time.time(), unavailable, probe)
+
+    def cancel_probe(self, url: str):
+        """Give back the probe of a half-open circuit when the request was not sent after all."""
+        with self._lock:
+            self._host(url)[1].cancel_probe()
+
+    def try_retry(self, url: str) -> bool:
+        """Spend one retry from the host and global budgets. Returns False if either is exhausted."""
+        now = time.time()
+        with self._lock:
+            budget = self._host(url)[0]
+            if not (budget.can_retry(now) and self._global_budget.can_retry(now)):
+                return False
+            budget.spend(now)
+            self._global_budget.spend(now)
+            return True
+
+    def backoff(self, attempt: int, backoff_factor: float, retry_after: Optional[float] = None) -> float:
+        """Exponential backoff with jitter, never shorter than Retry-After (both capped at max_delay)."""
+        delay = min(self.max_delay, backoff_factor * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class DelayQueue:
+    """Holds items until their due time, then passes them to `release` from a background thread."""
+
+    def __init__(self, release: Callable):
+        self.release = release
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='retry-delay', daemon=True)
+        self._thread.start()
+
+    def schedule(self, item, delay: float):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), item))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, item = heapq.heappop(self._heap)
+            self.release(item)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+
+_retry_scheduler = RetryScheduler()
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    """Return the process-wide retry scheduler."""
+    return _retry_scheduler
@@ -0,0 +1,109 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout, RequestException, HTTPError
+from logs import logger
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_KEEP_ALIVE, HTTP2_ENABLED
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 support is optional
+    httpx = None
+
+
+class Http2Response:
+    """Wraps an httpx response so callers can treat it like a requests response."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.text = response.text
+        self.content = response.content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} Error for url: {self._response.url}", response=self)
+
+
+class SessionPool:
+    """
+    Pooled HTTP sessions with one session per User-Agent.
+
+    Every identity keeps its own cookies and its own keep-alive connections,
+    so consecutive requests with the same User-Agent skip the TCP and TLS
+    handshakes and look like one browser to the server.
+    """
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, keep_alive=HTTP_KEEP_ALIVE, http2=HTTP2_ENABLED):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.http2 = http2 and httpx is not None
+        if http2 and httpx is None:
+            logger.warning("HTTP2_ENABLED is set but httpx is not installed. Falling back to HTTP/1.1.")
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self, user_agent, proxy=None):
+        if self.http2:
+            limits = httpx.Limits(
+                max_connections=self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize if self.keep_alive else 0,
+            )
+            return httpx.Client(http2=True, limits=limits, headers={'User-Agent': user_agent}, follow_redirects=True, proxy=proxy)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = user_agent
+        if proxy:
+            session.proxies = {'http': proxy, 'https': proxy}
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def session_for(self, user_agent, proxy=None):
+        """Return the session bound to a User-Agent (and proxy), creating it on first use."""
+        with self._lock:
+            session = self._sessions.get((user_agent, proxy))
+            if session is None:
+                session = self._sessions[(user_agent, proxy)] = self._create_session(user_agent, proxy)
+            return session
+
+    def get(self, url, user_agent, headers=None, timeout=10, proxy=None):
+        """Send a GET request through the session of `user_agent` (and `proxy`)."""
+        session = self.session_for(user_agent, proxy)
+        if not self.http2:
+            return session.get(url, headers=headers, timeout=timeout)
+
+        # Translate httpx errors so callers only deal with requests exceptions
+        try:
+            return Http2Response(session.get(url, headers=headers, timeout=timeout))
+        except httpx.TimeoutException as e:
+            raise Timeout(str(e))
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e))
+        except httpx.HTTPError as e:
+            raise RequestException(str(e))
+
+    def close(self):
+        """Close every session and its pooled connections."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """Return the process-wide session pool."""
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool()
+        return _session_pool
@@ -0,0 +1,92 @@
+import re
+from typing import Iterable, List, Tuple
+from urllib.parse import unquote, urlparse, parse_qs
+from config import AMAZON_BASE_URL
+
+def extract_asin(url):
+    """Extract ASIN from Amazon URLs (direct or tracked)."""
+    # Decode URL-encoded characters
+    decoded_url = unquote(url)
+    
+    # Case 1: ASIN in the URL path (e.g., /dp/B0XXXXXX)
+    asin_pattern = r"/dp/([A-Z0-9]{10})|/gp/product/([A-Z0-9]{10})"
+    match = re.search(asin_pattern, decoded_url)
+    if match:
+        asin = (match.group(1) or match.group(2)).upper()
+        return asin
+    
+    # Case 2: ASIN in query parameters (e.g., pd_rd_i=B0XXXXXX)
+    parsed_url = urlparse(decoded_url)
+    query_params = parse_qs(parsed_url.query)
+    
+    # Check common ASIN-carrying parameters
+    asin_params = ["pd_rd_i", "asin", "product_id"]
+    for param in asin_params:
+        if param in query_params:
+            asin_candidate = query_params[param][0]
+            if len(asin_candidate) == 10 and asin_candidate.isalnum():
+                return asin_candidate.upper()  # ASINs are uppercase
+    
+    return None
+
+def canonicalize_product_url(url):
+    """
+    Rewrite an Amazon product link to its canonical form (<origin>/dp/<ASIN>, AMAZON_BASE_URL for relative links).
+
+    Tracking parameters (dib, qid, sr, ref, ...) are dropped, so every link to the same
+    product maps to the same URL. Links without an ASIN are returned unchanged.
+    """
+    asin = extract_asin(url)
+    if asin is None:
+        return url
+    parsed_url = urlparse(url)
+    origin = f"{parsed_url.scheme}://{parsed_url.netloc}" if parsed_url.netloc else AMAZON_BASE_URL
+    return f"{origin}/dp/{asin}"
+
+
+def batch_search_url(asins: Iterable[str], origin: str = AMAZON_BASE_URL) -> str:
+    """Return a search URL listing exactly the given ASINs (through the p_78 ASIN refinement)."""
+    return f"{origin}/s?rh=p_78%3A{'%7C'.join(asins)}"
+
+
+def batch_search_asins(url: str) -> List[str]:
+    """Return the ASINs requested by a batch search URL (see batch_search_url)."""
+    refinement = parse_qs(urlparse(url).query).get('rh', [''])[0]
+    if not refinement.startswith('p_78:'):
+        return []
+    return [asin for asin in refinement[len('p_78:'):].split('|') if asin]
+
+
+def batch_product_urls(url: str) -> List[str]:
+    """Return the canonical product URLs of the ASINs requested by a batch search URL."""
+    parsed_url = urlparse(url)
+    return [f"{parsed_url.scheme}://{parsed_url.netloc}/dp/{asin}" for asin in batch_search_asins(url)]
+
+
+def batch_search_urls(product_urls: Iterable[str], batch_size: int) -> Tuple[List[str], List[str]]:
+    """
+    Group product links into batch search URLs of at most `batch_size` ASINs.
+
+    Links are grouped per site, so a watchlist mixing Amazon domains gets one
+    set of batches per domain.
+
+    Returns:
+    - Tuple of the batch search URLs and the links without an ASIN (they cannot be batched)
+    """
+    asins_by_origin, unbatched = {}, []
+    for url in product_urls:
+        asin = extract_asin(url)
+        if asin is None:
+            unbatched.append(url)
+            continue
+        parsed_url = urlparse(url)
+        origin = f"{parsed_url.scheme}://{parsed_url.netloc}" if parsed_url.netloc else AMAZON_BASE_URL
+        # A dict keeps the ASINs in watchlist order without duplicates
+        asins_by_origin.setdefault(origin, {})[asin] = None
+    batch_size = max(1, int(batch_size))
+    batch_urls = []
+    for origin, asins in asins_by_origin.items():
+        asins = list(asins)
+        for start in range(0, len(asins), batch_size):
+            batch_urls.append(batch_search_url(asins[start:start + batch_size], origin))
+    return batch_urls, unbatched